@@ -3,10 +3,11 @@ import pandas as pd
 import numpy as np
 import time
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta
 import warnings
 import os
-import pickle
+import json
 
 # 配置logging
 logger = logging.getLogger(__name__)
@@ -16,23 +17,32 @@ os.environ['AKSHARE_HEADERS'] = '{"User-Agent": "Mozilla/5.0 (Windows NT 10.0; W
 warnings.filterwarnings('ignore')
 
 try:
-    import akshare as ak
     from lightgbm import LGBMClassifier
-    from sklearn.utils.class_weight import compute_class_weight
-    from data_fetch import get_stock_daily
-    from predict import calc_features_safe
-    from db import save_backtest_result, query_backtest_results
+    from data_fetch import get_stock_daily, _init_baostock
+    from predict import calc_features_vectorized
+    from db import save_backtest_result
     from stock_utils import get_market_board
     # 导入交易日历相关功能（这里暂时使用简单的判断，后面会引入calendar模块）
 except ImportError as e:
     raise RuntimeError(f"Missing dependency: {e}")
 
+# numba为可选依赖：缺失时@njit退化为普通Python函数
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+        if len(args) == 1 and callable(args[0]):
+            return decorator(args[0])
+        return decorator
+
 # 回测缓存
 _backtest_cache = {}
 _last_backtest_update = {}
 
-# 缓存文件路径定义
-BACKTEST_CACHE_FILE = 'backtest_cache.pkl'
+# 缓存目录定义：每个cache_key一个元数据JSON + 一个daily_values parquet
+BACKTEST_CACHE_DIR = 'backtest_cache'
 
 
 # ==============================
@@ -40,44 +50,167 @@ BACKTEST_CACHE_FILE = 'backtest_cache.pkl'
 # ==============================
 def load_backtest_cache():
     """
-    从文件加载回测结果缓存
+    从缓存目录加载回测结果的元数据
+    daily_values（大头）留在parquet文件中，首次访问时才读取
     """
     global _backtest_cache, _last_backtest_update
     try:
-        if os.path.exists(BACKTEST_CACHE_FILE):
-            with open(BACKTEST_CACHE_FILE, 'rb') as f:
-                data = pickle.load(f)
-                if isinstance(data, dict) and 'cache' in data and 'last_update' in data:
-                    _backtest_cache = data['cache']
-                    _last_backtest_update = data['last_update']
-                    logger.info(f"从本地文件加载回测缓存成功，共 {len(_backtest_cache)} 条数据")
-                    return True
+        if not os.path.isdir(BACKTEST_CACHE_DIR):
+            return False
+        count = 0
+        for fname in os.listdir(BACKTEST_CACHE_DIR):
+            if not fname.endswith('.json'):
+                continue
+            cache_key = fname[:-5]
+            with open(os.path.join(BACKTEST_CACHE_DIR, fname), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            _last_backtest_update[cache_key] = meta.pop('_last_update', 0)
+            meta['daily_values'] = None  # 惰性加载标记
+            _backtest_cache[cache_key] = meta
+            count += 1
+        if count:
+            logger.info(f"从本地缓存目录加载回测缓存成功，共 {count} 条数据")
+            return True
     except Exception as e:
         logger.error(f"加载回测缓存失败：{e}")
     return False
 
 
-def save_backtest_cache():
+def save_backtest_cache(cache_key=None):
     """
-    将回测结果缓存保存到文件
+    将回测结果缓存保存到目录
+    - cache_key: 只写入该key对应的文件；为None时写入全部
+
+    每次只写变更的那一条结果（元数据JSON + daily_values parquet），
+    避免旧版整包pickle每次更新都重写整个缓存的O(N)磁盘IO。
     """
     try:
-        with open(BACKTEST_CACHE_FILE, 'wb') as f:
-            pickle.dump({
-                'cache': _backtest_cache,
-                'last_update': _last_backtest_update
-            }, f)
-        logger.info(f"回测缓存已保存到本地文件，共 {len(_backtest_cache)} 条数据")
+        os.makedirs(BACKTEST_CACHE_DIR, exist_ok=True)
+        keys = [cache_key] if cache_key else list(_backtest_cache.keys())
+        for key in keys:
+            result = _backtest_cache.get(key)
+            if result is None:
+                continue
+            meta = {k: v for k, v in result.items() if k != 'daily_values'}
+            meta['_last_update'] = _last_backtest_update.get(key, time.time())
+            with open(os.path.join(BACKTEST_CACHE_DIR, f"{key}.json"), 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            daily_values = result.get('daily_values')
+            if daily_values:
+                pd.DataFrame.from_dict(daily_values, orient='index', columns=['cumulative_return']).to_parquet(
+                    os.path.join(BACKTEST_CACHE_DIR, f"{key}_values.parquet")
+                )
         return True
     except Exception as e:
         logger.error(f"保存回测缓存失败：{e}")
     return False
 
 
+def _load_cached_daily_values(cache_key):
+    """
+    按需从parquet读取指定cache_key的daily_values
+    """
+    path = os.path.join(BACKTEST_CACHE_DIR, f"{cache_key}_values.parquet")
+    try:
+        if os.path.exists(path):
+            return pd.read_parquet(path)['cumulative_return'].to_dict()
+    except Exception as e:
+        logger.error(f"读取回测daily_values缓存失败：{e}")
+    return {}
+
+
 # ==============================
 # 📊 回测功能
 # ==============================
-def backtest_ai_strategy(symbol, name, start_date='2023-01-01', end_date='2024-12-31', initial_capital=100000, transaction_cost=0.001):
+@njit(cache=True)
+def _simulate_trades(closes, probs, capital, shares, transaction_cost):
+    """
+    交易执行状态机（纯数值循环，numba编译消除解释器开销）
+    - closes: 测试窗口收盘价数组(float64)
+    - probs: 对应的模型上涨概率数组(float64)
+    - capital/shares: 进入本窗口时的资金与持仓
+    - transaction_cost: 交易成本
+
+    返回 (actions, trade_shares, capitals, daily_vals, capital, shares)，
+    actions为每日交易动作（1买入/-1卖出/0无），其余为平行数组，
+    由调用方在Python侧写入预分配的交易/每日价值数组。
+    """
+    n = closes.shape[0]
+    actions = np.zeros(n, dtype=np.int8)
+    trade_shares = np.zeros(n, dtype=np.float64)
+    capitals = np.zeros(n, dtype=np.float64)
+    daily_vals = np.zeros(n, dtype=np.float64)
+
+    for i in range(n):
+        price = closes[i]
+        prob = probs[i]
+
+        if prob > 0.6 and shares == 0:
+            # 买入（按手取整）
+            shares_to_buy = capital // (price * 100) * 100
+            cost = shares_to_buy * price * (1 + transaction_cost)
+            if cost <= capital:
+                shares = shares_to_buy
+                capital -= cost
+                actions[i] = 1
+                trade_shares[i] = shares_to_buy
+        elif prob < 0.4 and shares > 0:
+            # 卖出
+            proceeds = shares * price * (1 - transaction_cost)
+            capital += proceeds
+            actions[i] = -1
+            trade_shares[i] = shares
+            shares = 0.0
+
+        capitals[i] = capital
+        daily_vals[i] = capital + shares * price
+
+    return actions, trade_shares, capitals, daily_vals, capital, shares
+
+
+@njit(cache=True)
+def _compute_metrics(values):
+    """
+    单次遍历计算回测指标：最大回撤(%)与夏普比率
+    - values: 每日总资产数组(float64)
+
+    等价于pandas的cummax/drawdown/pct_change/mean/std多趟计算，
+    但只从内存流过values一次（回撤）加一次（收益率方差）。
+    """
+    n = values.shape[0]
+
+    # 最大回撤
+    peak = values[0]
+    max_drawdown = 0.0
+    for i in range(n):
+        if values[i] > peak:
+            peak = values[i]
+        drawdown = (values[i] - peak) / peak * 100.0
+        if drawdown < max_drawdown:
+            max_drawdown = drawdown
+
+    # 夏普比率（日收益率均值/标准差，ddof=1与pandas一致）
+    sharpe_ratio = 0.0
+    if n > 2:
+        mean_ret = 0.0
+        for i in range(1, n):
+            mean_ret += values[i] / values[i - 1] - 1.0
+        mean_ret /= (n - 1)
+
+        var_ret = 0.0
+        for i in range(1, n):
+            diff = values[i] / values[i - 1] - 1.0 - mean_ret
+            var_ret += diff * diff
+        var_ret /= (n - 2)
+
+        std_ret = np.sqrt(var_ret)
+        if std_ret != 0:
+            sharpe_ratio = mean_ret / std_ret * np.sqrt(252.0)
+
+    return max_drawdown, sharpe_ratio
+
+
+def backtest_ai_strategy(symbol, name, start_date='2023-01-01', end_date='2024-12-31', initial_capital=100000, transaction_cost=0.001, min_prob_range=0.02):
     """
     回测AI策略的性能
     - symbol: 股票代码
@@ -86,6 +219,7 @@ def backtest_ai_strategy(symbol, name, start_date='2023-01-01', end_date='2024-1
     - end_date: 回测结束日期
     - initial_capital: 初始资金
     - transaction_cost: 交易成本
+    - min_prob_range: 测试窗口内预测概率极差低于该值时，下一折跳过重训直接复用当前模型
     """
     logger.info(f"开始回测股票 {symbol} ({name}) 的AI策略")
     try:
@@ -95,154 +229,173 @@ def backtest_ai_strategy(symbol, name, start_date='2023-01-01', end_date='2024-1
             logger.warning(f"[{symbol}] 数据不足或获取失败，无法进行回测")
             return None
 
-        # 筛选回测期间的数据
-        df = df[(df.index >= start_date) & (df.index <= end_date)]
+        # 筛选回测期间的数据：searchsorted定位整数区间，一次切片代替布尔掩码拷贝
+        i0 = df.index.searchsorted(pd.Timestamp(start_date), side='left')
+        i1 = df.index.searchsorted(pd.Timestamp(end_date), side='right')
+        df = df.iloc[i0:i1]
         if len(df) < 200:
             logger.warning(f"[{symbol}] 回测期间数据不足，无法进行回测")
             return None
 
+        # 一次性向量化计算全量特征矩阵，后续训练/预测只按行切片
+        # 避免训练循环中对增长窗口重复调用calc_features_safe的O(N²)开销
+        features = calc_features_vectorized(df)
+        if features is None:
+            logger.warning(f"[{symbol}] 数据不足，无法计算特征")
+            return None
+
+        # 热路径只用NumPy视图：收盘价与日期各提取一次，折内全部整数切片
+        close_arr = df['close'].to_numpy(dtype=np.float64)
+        date_arr = df.index.to_numpy()
+
+        # 训练标签一次性算好（第i行=第i+1日是否上涨），折内直接整数切片
+        next_day_ret = np.full(len(close_arr), np.nan)
+        next_day_ret[:-1] = close_arr[1:] / close_arr[:-1] - 1
+        labels = (next_day_ret > 0).astype(np.int8)
+
         # 初始化回测参数
-        capital = initial_capital
-        shares = 0
-        trades = []
-        positions = []
-        daily_values = []
+        capital = float(initial_capital)
+        shares = 0.0
+
+        # SoA布局：预分配整段回测的平行数组，避免逐日创建Python字典的分配/GC开销
+        n_days = len(df)
+        daily_value_arr = np.empty(n_days, dtype=np.float64)
+        daily_date_arr = np.empty(n_days, dtype='datetime64[ns]')
+        n_daily = 0
+
+        trade_date_arr = np.empty(n_days, dtype='datetime64[ns]')
+        trade_action_arr = np.empty(n_days, dtype=np.int8)
+        trade_price_arr = np.empty(n_days, dtype=np.float64)
+        trade_shares_arr = np.empty(n_days, dtype=np.float64)
+        trade_capital_arr = np.empty(n_days, dtype=np.float64)
+        trade_total_arr = np.empty(n_days, dtype=np.float64)
+        n_trades = 0
 
         train_window = 100  # 训练窗口大小
         test_window = 10    # 测试窗口大小
 
+        # 增量训练状态：复用上一折的booster，每折只学习新增的样本
+        prev_booster = None
+        fitted_end = 0  # 已参与训练的特征行终点（iloc位置）
+        model = None
+        skip_retrain = False  # 上一折概率区分度过低时，本折不重训
+
+        # 类别计数增量维护：balanced权重有闭式解 n/(2·count)，无需每折跑sklearn
+        pos_count = 0
+        neg_count = 0
+        counted_end = 59  # 已计数的标签行终点（iloc位置）
+
         # 分批次回测
         for i in range(train_window, len(df), test_window):
-            # 训练数据
+            # 训练数据/测试数据只记录整数区间，不再构造中间DataFrame
             train_end = i - 1
-            train_data = df.iloc[:train_end+1]
-            
-            # 测试数据
             test_start = i
             test_end = min(i + test_window - 1, len(df) - 1)
-            test_data = df.iloc[test_start:test_end+1]
 
-            if len(train_data) < 100 or len(test_data) < 1:
+            if train_end + 1 < 100 or test_end < test_start:
                 continue
 
-            # 训练模型
-            X_train = []
-            y_train = []
-
-            for j in range(60, len(train_data)):
-                window_data = train_data.iloc[:j]
-                feat = calc_features_safe(window_data)
-                if feat is None:
-                    continue
-                X_train.append(feat)
-                ret = (train_data.iloc[j]['close'] - train_data.iloc[j-1]['close']) / train_data.iloc[j-1]['close']
-                y_train.append(int(ret > 0))
+            # 训练模型：直接切片预计算好的特征矩阵
+            # 第j-1行特征对应原来calc_features_safe(train_data.iloc[:j])，标签为第j日涨跌
+            X_train = features.iloc[59:train_end]
+            y_train = labels[59:train_end]
 
             if len(X_train) < 50:
                 continue
 
-            X_train = pd.DataFrame(X_train)
-            y_train = np.array(y_train)
-
-            # 处理类别不平衡问题
-            classes = np.unique(y_train)
-            class_weight = dict(zip(classes, compute_class_weight('balanced', classes=classes, y=y_train))) if len(classes) == 2 else None
-
-            # 训练模型
-            model = LGBMClassifier(
-                n_estimators=80,
-                max_depth=4,
-                random_state=42,
-                verbose=-1,
-                class_weight=class_weight
+            # 处理类别不平衡问题：只统计新增标签，按闭式解算balanced权重
+            if train_end > counted_end:
+                new_pos = int(labels[counted_end:train_end].sum())
+                pos_count += new_pos
+                neg_count += train_end - counted_end - new_pos
+                counted_end = train_end
+            total = pos_count + neg_count
+            class_weight = {0: total / (2 * neg_count), 1: total / (2 * pos_count)} if pos_count and neg_count else None
+
+            # 训练模型：首折全量训练，此后基于上一折booster只学习新增样本
+            # 避免每个test_window都从头重建整段历史的模型（训练量从Σi·N降为N）
+            # 上一折信号近乎常数时跳过重训（几十条增量样本改变不了决策），直接复用现有模型
+            if model is None or not skip_retrain:
+                if prev_booster is None:
+                    X_fit, y_fit = X_train, y_train
+                    n_estimators = 80
+                else:
+                    X_fit = features.iloc[fitted_end:train_end]
+                    y_fit = labels[fitted_end:train_end]
+                    n_estimators = 10  # 每折只追加少量新树
+
+                model = LGBMClassifier(
+                    n_estimators=n_estimators,
+                    max_depth=4,
+                    random_state=42,
+                    verbose=-1,
+                    class_weight=class_weight
+                )
+                model.fit(X_fit, y_fit, init_model=prev_booster)
+                prev_booster = model.booster_
+                fitted_end = train_end
+
+            # 回测测试集：整个测试窗口一次批量预测，避免每天一次predict_proba调用的开销
+            X_test = features.iloc[test_start - 1:test_end].reindex(columns=X_train.columns, fill_value=0)
+            probs = model.predict_proba(X_test.to_numpy())[:, 1]
+
+            # 首折之外，概率极差低于阈值视为无区分度信号，下一折省掉一次重训
+            skip_retrain = float(np.ptp(probs)) < min_prob_range
+
+            # 整数切片取出测试窗口的价格与日期（NumPy视图，零拷贝）
+            closes = close_arr[test_start:test_end + 1]
+            date_vals = date_arr[test_start:test_end + 1]
+
+            # 执行交易：编译后的状态机只吃NumPy数组，结果切片写入预分配数组
+            actions, trade_shares, capitals, daily_vals, capital, shares = _simulate_trades(
+                closes, probs, capital, shares, transaction_cost
             )
-            model.fit(X_train, y_train)
-
-            # 回测测试集
-            for idx, (date, row) in enumerate(test_data.iterrows()):
-                # 计算特征
-                window_data = df.iloc[:test_start+idx]
-                feat = calc_features_safe(window_data)
-                if feat is None:
-                    continue
-
-                # 预测信号
-                prob = model.predict_proba([feat.reindex(X_train.columns, fill_value=0)])[0][1]
-                
-                # 生成交易信号
-                signal = 0  # 0: 持有, 1: 买入, -1: 卖出
-                if prob > 0.6:
-                    signal = 1
-                elif prob < 0.4:
-                    signal = -1
-
-                # 执行交易
-                if signal == 1 and shares == 0:
-                    # 买入
-                    shares_to_buy = capital // (row['close'] * 100) * 100
-                    cost = shares_to_buy * row['close'] * (1 + transaction_cost)
-                    if cost <= capital:
-                        shares = shares_to_buy
-                        capital -= cost
-                        trades.append({
-                            'date': date,
-                            'action': 'buy',
-                            'price': row['close'],
-                            'shares': shares_to_buy,
-                            'capital': capital,
-                            'total_value': capital + shares * row['close']
-                        })
-                elif signal == -1 and shares > 0:
-                    # 卖出
-                    proceeds = shares * row['close'] * (1 - transaction_cost)
-                    capital += proceeds
-                    trades.append({
-                        'date': date,
-                        'action': 'sell',
-                        'price': row['close'],
-                        'shares': shares,
-                        'capital': capital,
-                        'total_value': capital
-                    })
-                    shares = 0
-
-                # 记录每日价值
-                daily_value = capital + (shares * row['close'] if shares > 0 else 0)
-                daily_values.append({
-                    'date': date,
-                    'value': daily_value,
-                    'return': (daily_value / initial_capital - 1) * 100
-                })
-
-        if not daily_values:
+
+            m = len(closes)
+            daily_value_arr[n_daily:n_daily + m] = daily_vals
+            daily_date_arr[n_daily:n_daily + m] = date_vals
+            n_daily += m
+
+            # 只保留有交易动作的日子
+            traded = np.nonzero(actions)[0]
+            k = len(traded)
+            if k:
+                trade_date_arr[n_trades:n_trades + k] = date_vals[traded]
+                trade_action_arr[n_trades:n_trades + k] = actions[traded]
+                trade_price_arr[n_trades:n_trades + k] = closes[traded]
+                trade_shares_arr[n_trades:n_trades + k] = trade_shares[traded]
+                trade_capital_arr[n_trades:n_trades + k] = capitals[traded]
+                # 买入日总资产=资金+持仓市值，卖出日已全部变现
+                trade_total_arr[n_trades:n_trades + k] = np.where(
+                    actions[traded] == 1,
+                    capitals[traded] + trade_shares[traded] * closes[traded],
+                    capitals[traded]
+                )
+                n_trades += k
+
+        if n_daily == 0:
             logger.warning(f"[{symbol}] 回测期间无有效数据，无法生成回测结果")
             return None
 
-        # 计算回测指标
-        df_values = pd.DataFrame(daily_values)
-        df_values.set_index('date', inplace=True)
-        df_values['cumulative_return'] = (df_values['value'] / initial_capital - 1) * 100
+        # 计算回测指标：单次NumPy遍历融合cummax/回撤/收益率计算
+        # 替代原来peak/drawdown/pct_change多列pandas多趟扫描
+        values = daily_value_arr[:n_daily]
+        dates = pd.DatetimeIndex(daily_date_arr[:n_daily])
+        cumulative_returns = ((values / initial_capital - 1) * 100).tolist()
 
-        # 计算最大回撤
-        df_values['peak'] = df_values['value'].cummax()
-        df_values['drawdown'] = (df_values['value'] - df_values['peak']) / df_values['peak'] * 100
-        max_drawdown = df_values['drawdown'].min()
+        max_drawdown, sharpe_ratio = _compute_metrics(values)
 
         # 计算年化收益率
-        start_date = df_values.index[0]
-        end_date = df_values.index[-1]
+        start_date = dates[0]
+        end_date = dates[-1]
         days = (end_date - start_date).days
-        annual_return = (df_values['value'].iloc[-1] / initial_capital) ** (365 / days) - 1
+        annual_return = (values[-1] / initial_capital) ** (365 / days) - 1
         annual_return_pct = annual_return * 100
 
-        # 计算夏普比率
-        daily_returns = df_values['value'].pct_change().dropna()
-        sharpe_ratio = (daily_returns.mean() / daily_returns.std()) * np.sqrt(252) if daily_returns.std() != 0 else 0
-
-        # 计算胜率
-        if trades:
-            winning_trades = [t for t in trades if t['action'] == 'sell' and t['total_value'] > initial_capital]
-            win_rate = len(winning_trades) / len(trades) * 100 if len(trades) > 0 else 0
+        # 计算胜率（卖出且落袋总资产超过初始资金的交易）
+        if n_trades:
+            winning = int(np.sum((trade_action_arr[:n_trades] == -1) & (trade_total_arr[:n_trades] > initial_capital)))
+            win_rate = winning / n_trades * 100
         else:
             win_rate = 0
 
@@ -254,14 +407,14 @@ def backtest_ai_strategy(symbol, name, start_date='2023-01-01', end_date='2024-1
             'start_date': start_date.strftime('%Y-%m-%d'),
             'end_date': end_date.strftime('%Y-%m-%d'),
             'initial_capital': initial_capital,
-            'final_capital': df_values['value'].iloc[-1],
-            'total_return_pct': (df_values['value'].iloc[-1] / initial_capital - 1) * 100,
-            'annual_return_pct': annual_return_pct,
-            'max_drawdown_pct': max_drawdown,
-            'sharpe_ratio': sharpe_ratio,
+            'final_capital': float(values[-1]),
+            'total_return_pct': float((values[-1] / initial_capital - 1) * 100),
+            'annual_return_pct': float(annual_return_pct),
+            'max_drawdown_pct': float(max_drawdown),
+            'sharpe_ratio': float(sharpe_ratio),
             'win_rate_pct': win_rate,
-            'total_trades': len(trades),
-            'daily_values': df_values['cumulative_return'].to_dict()
+            'total_trades': n_trades,
+            'daily_values': dict(zip(dates, cumulative_returns))
         }
 
         # 保存回测结果到数据库
@@ -292,7 +445,11 @@ def backtest_ai_strategy_cached(symbol, name, start_date='2023-01-01', end_date=
     # 缓存有效期为24小时
     if cache_key in _backtest_cache and (now - _last_backtest_update.get(cache_key, 0) < 24 * 3600):
         logger.info(f"使用缓存的回测结果: {symbol} ({name})")
-        return _backtest_cache[cache_key]
+        cached = _backtest_cache[cache_key]
+        # daily_values惰性加载：首次命中时才读parquet
+        if cached.get('daily_values') is None:
+            cached['daily_values'] = _load_cached_daily_values(cache_key)
+        return cached
     
     # 执行回测
     result = backtest_ai_strategy(symbol, name, start_date, end_date, initial_capital, transaction_cost)
@@ -302,6 +459,47 @@ def backtest_ai_strategy_cached(symbol, name, start_date='2023-01-01', end_date=
         _backtest_cache[cache_key] = result
         _last_backtest_update[cache_key] = now
         logger.info(f"更新回测缓存: {symbol} ({name})")
-        save_backtest_cache()  # 保存缓存到文件
+        save_backtest_cache(cache_key)  # 只写入本次变更的结果文件
     
     return result
+
+
+def backtest_many(symbols_names, start_date='2023-01-01', end_date='2024-12-31', initial_capital=100000, transaction_cost=0.001, max_workers=None):
+    """
+    并行回测多只股票
+    - symbols_names: (股票代码, 股票名称)元组列表
+    - 其余参数与backtest_ai_strategy_cached相同
+    - max_workers: 进程数，默认为CPU核数
+
+    每只股票的回测相互独立（无共享可变状态），用进程池并行执行。
+    子进程各自命中数据库/文件缓存，结果汇总后合并回主进程缓存。
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count()
+
+    results = {}
+    # 每个工作进程启动时登录一次Baostock，避免各任务首次降级取数时各自登录
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_baostock) as executor:
+        futures = {
+            executor.submit(backtest_ai_strategy_cached, symbol, name,
+                            start_date, end_date, initial_capital, transaction_cost): symbol
+            for symbol, name in symbols_names
+        }
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"[{symbol}] 并行回测失败: {str(e)}")
+                continue
+            if result:
+                results[symbol] = result
+                # 合并子进程结果到主进程缓存
+                cache_key = f"{symbol}_{start_date}_{end_date}_{initial_capital}_{transaction_cost}"
+                _backtest_cache[cache_key] = result
+                _last_backtest_update[cache_key] = time.time()
+
+    # 子进程内的backtest_ai_strategy_cached已逐条落盘，无需再整体保存
+
+    logger.info(f"并行回测完成，共 {len(results)}/{len(symbols_names)} 只股票成功")
+    return results
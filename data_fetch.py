@@ -1,18 +1,18 @@
 # data_fetch.py
+import atexit
 import pandas as pd
 import numpy as np
 import time
 import warnings
 import logging
 from datetime import datetime
+from functools import lru_cache
+from collections import OrderedDict
 import os
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-
 # 导入数据库操作模块
 from db import query_stock_data, check_data_completeness, batch_insert_stock_data
 from trade_calendar import get_current_trading_day
+from http_session import init_akshare_session as _init_session
 
 # 配置logging
 logger = logging.getLogger(__name__)
@@ -29,6 +29,9 @@ try:
 except ImportError as e:
     raise RuntimeError(f"Missing dependency: {e}")
 
+# 盘中数据刷新时间戳：symbol -> 上次从外部API刷新当日数据的time.time()
+_last_intraday_refresh: dict[str, float] = {}
+
 # ==============================
 # 📦 Baostock 初始化
 # ==============================
@@ -37,17 +40,14 @@ _bs_initialized = False
 
 def _init_baostock():
     """
-    初始化 Baostock 连接，增加重连机制
+    初始化 Baostock 连接；已登录时直接复用，只有出错后（_logout_baostock）才会重新登录
     """
     global _bs_initialized
     try:
-        # 先尝试登出旧连接
+        # 连接仍然有效，避免无意义的logout/login往返
         if _bs_initialized:
-            bs.logout()
-            _bs_initialized = False
-            time.sleep(1)  # 等待 1 秒后重新登录
-        
-        # 重新登录
+            return True
+
         lg = bs.login()
         if lg.error_code != '0':
             logger.error(f"[Baostock] Login failed: {lg.error_msg}")
@@ -74,18 +74,121 @@ def _logout_baostock():
             _bs_initialized = False
 
 
+# 进程退出时统一登出，替代每次用完就logout的做法
+atexit.register(_logout_baostock)
+
+
 # ==============================
 # 📊 数据获取（双源容错 + 数据库缓存）
 # ==============================
+# AkShare中文列名映射
+_AK_COLUMN_MAP = {
+    '日期': 'date',
+    '开盘': 'open',
+    '最高': 'high',
+    '最低': 'low',
+    '收盘': 'close',
+    '成交量': 'volume',      # 单位：手
+    '成交额': 'amount',
+    '涨跌幅': 'pct_chg',
+    '换手率': 'turnover'
+}
+
+
+def _normalize_history(raw_df, source='ak'):
+    """
+    将原始行情DataFrame规整为统一schema：index=datetime, columns=[open, high, low, close, volume]
+    - source: 'ak'（AkShare中文列，成交量单位为手）或 'bs'（Baostock英文列）
+
+    日期解析指定format（远快于自动推断），清洗用单次布尔掩码完成，
+    替代原来三处重复的rename/to_datetime/set_index/sort_index/清洗块。
+    """
+    if raw_df is None or raw_df.empty:
+        return pd.DataFrame()
+
+    if source == 'ak':
+        df = raw_df.rename(columns=_AK_COLUMN_MAP)
+    else:
+        df = raw_df.copy()
+        # Baostock返回字符串列，转换数值类型
+        for col in ['open', 'high', 'low', 'close', 'volume']:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        df.dropna(subset=['open', 'high', 'low', 'close', 'volume'], inplace=True)
+
+    try:
+        df['date'] = pd.to_datetime(df['date'], format='%Y-%m-%d')
+    except (ValueError, TypeError):
+        df['date'] = pd.to_datetime(df['date'])
+    df.set_index('date', inplace=True)
+    df.sort_index(inplace=True)
+
+    if source == 'ak':
+        # 转换成交量为"股"
+        df['volume'] = df['volume'] * 100
+
+    # 清洗异常值（单次布尔掩码）
+    mask = (df['close'] > 0.1) & (df['close'] < 1000) & (df['volume'] >= 0)
+    return df.loc[mask, ['open', 'high', 'low', 'close', 'volume']]
+
+
+def _to_save_frame(df):
+    """
+    转换为入库格式：重置索引，价格列降为float32（A股价格两位小数，单精度精度足够，入库数据量减半）
+    """
+    save_df = df.reset_index()
+    price_cols = ['open', 'high', 'low', 'close']
+    save_df[price_cols] = save_df[price_cols].astype(np.float32)
+    return save_df
+
+@lru_cache(maxsize=1)
+def _current_trading_day_cached(minute_bucket):
+    """
+    按分钟桶缓存最近交易日，同一分钟内的批量调用只查一次交易日历
+    """
+    return get_current_trading_day()
+
+
+def _get_current_trading_day():
+    return _current_trading_day_cached(int(time.time() // 60))
+
+
+# 日线结果缓存：(symbol, 最近交易日) -> DataFrame
+# 只缓存成功结果：双源都失败返回的空DataFrame不入缓存，下次调用照常重试，
+# 避免一次瞬时故障把"无数据"钉死一整个交易日
+_daily_result_cache = OrderedDict()
+_DAILY_CACHE_MAX = 512
+
+
 def get_stock_daily(symbol: str):
     """
     双源容错获取个股日线数据（优先从数据库获取，其次本地缓存，最后外部API）
     返回标准 DataFrame：index=datetime, columns=[open, high, low, close, volume]
     volume 单位：股（非手）
+
+    同一交易日内对相同股票的重复调用直接命中进程内缓存，
+    避免每次都走"查库→可能刷新当天数据"的完整流程；交易日变化后key失效。
+    """
+    trading_day = _get_current_trading_day()
+    key = (symbol, trading_day.strftime('%Y-%m-%d') if trading_day else '')
+    df = _daily_result_cache.get(key)
+    if df is not None:
+        _daily_result_cache.move_to_end(key)
+        return df
+    df = _fetch_stock_daily(symbol)
+    if df is not None and not df.empty:
+        _daily_result_cache[key] = df
+        if len(_daily_result_cache) > _DAILY_CACHE_MAX:
+            _daily_result_cache.popitem(last=False)  # 淘汰最久未用的
+    return df
+
+
+def _fetch_stock_daily(symbol: str):
+    """
+    get_stock_daily的实际实现（无缓存）
     """
     # 1. 首先从数据库获取数据
     logger.info(f"[{symbol}] 尝试从数据库获取数据...")
-    last_trading_day = get_current_trading_day()
+    last_trading_day = _get_current_trading_day()
     logger.info(f"[{symbol}] 最近交易日为 {last_trading_day}")
     # 拼装为时间格式 15:00:00
     last_trading_day_str = last_trading_day.strftime("%Y-%m-%d") + " 15:00:00"
@@ -101,46 +204,31 @@ def get_stock_daily(symbol: str):
             # 检查当前时间是否在交易时段
             today = datetime.now().date()
             current_time = datetime.now()
-            current_hour = current_time.hour
-            current_minute = current_time.minute
-            
+
             # 获取交易日历（这里暂时使用简单的判断，后面会引入calendar模块）
             is_trading_day = True
-            
-            # 判断是否在交易时段（9:30-11:30, 13:00-15:00）
-            is_trading_hours = False
-            if 9 <= current_hour < 15:
-                if (current_hour == 9 and current_minute >= 30) or (10 <= current_hour < 11) or (current_hour == 11 and current_minute <= 30) or (13 <= current_hour < 15):
-                    is_trading_hours = True
-            
+
+            # 判断是否在交易时段（9:30-11:30, 13:00-15:00）：折算为分钟数后各一对比较
+            now_min = current_time.hour * 60 + current_time.minute
+            is_trading_hours = (570 <= now_min <= 690) or (780 <= now_min <= 900)
+
             logger.info(f"当前时间: {current_time}, 是交易日: {is_trading_day}, 是交易时间: {is_trading_hours}")
-            
+
+            # 盘中刷新限流：同一股票60秒内不重复打外部API（参数扫描等密集调用直接走数据库路径）
+            recently_refreshed = time.time() - _last_intraday_refresh.get(symbol, 0) < 60
+
             # 如果是交易日并且在交易时段，重新获取当天的数据
-            if is_trading_day and is_trading_hours:
+            if is_trading_day and is_trading_hours and not recently_refreshed:
                 logger.info(f"[{symbol}] 当天交易时段，重新获取当天数据")
                 
                 # 构造查询条件，只获取当天的数据
                 today_str = today.strftime("%Y%m%d")
                 
                 try:
-                    # 为AkShare配置请求重试策略
-                    session = requests.Session()
-                    retry_strategy = Retry(
-                        total=3,
-                        status_forcelist=[429, 500, 502, 503, 504],
-                        allowed_methods=["HEAD", "GET", "OPTIONS"],
-                        backoff_factor=1  # 指数退避
-                    )
-                    adapter = HTTPAdapter(max_retries=retry_strategy)
-                    session.mount("http://", adapter)
-                    session.mount("https://", adapter)
-                    
-                    # 设置全局超时
-                    session.timeout = 10  # 10秒超时
-                    
-                    # 替换AkShare的默认会话
-                    ak._session = session
-                    
+                    # 复用模块级持久会话（带重试策略）
+                    _init_session()
+                    _last_intraday_refresh[symbol] = time.time()
+
                     # 获取当天的数据
                     df_today = ak.stock_zh_a_hist(
                         symbol=symbol,
@@ -151,50 +239,23 @@ def get_stock_daily(symbol: str):
                     )
                     
                     if not df_today.empty:
-                        # 重命名中文列
-                        df_today.rename(columns={
-                            '日期': 'date',
-                            '开盘': 'open',
-                            '最高': 'high',
-                            '最低': 'low',
-                            '收盘': 'close',
-                            '成交量': 'volume',      # 单位：手
-                            '成交额': 'amount',
-                            '涨跌幅': 'pct_chg',
-                            '换手率': 'turnover'
-                        }, inplace=True)
-                        df_today['date'] = pd.to_datetime(df_today['date'])
-                        df_today.set_index('date', inplace=True)
-                        df_today.sort_index(inplace=True)
-                        # 转换成交量为“股”
-                        df_today['volume'] = df_today['volume'] * 100
-                        # 清洗异常值
-                        df_today = df_today[
-                            (df_today['close'] > 0.1) &
-                            (df_today['close'] < 1000) &
-                            (df_today['volume'] >= 0)
-                        ]
-                        
+                        # 规整为统一schema并清洗
+                        df_today = _normalize_history(df_today, source='ak')
+
                         if not df_today.empty:
                             # 更新数据库
-                            save_df = df_today[['open', 'high', 'low', 'close', 'volume']].copy().reset_index()
+                            save_df = _to_save_frame(df_today)
                             # 调试日志：输出保存数据的基本信息
                             logger.debug(f"[{symbol}] 准备保存当天数据，共 {len(save_df)} 条")
                             logger.debug(f"[{symbol}] 保存当天数据前5行:\n{save_df.head()}")
 
                             batch_insert_stock_data(save_df, symbol)
                             
-                            # 更新内存中的数据
-                            if today in df_db.index.date:
-                                # 如果数据库中已有当天的数据，替换它
-                                df_db = df_db[df_db.index.date != today]
-                                df_db = pd.concat([df_db, df_today])
-                                df_db.sort_index(inplace=True)
-                            else:
-                                # 如果数据库中没有当天的数据，添加它
-                                df_db = pd.concat([df_db, df_today])
-                                df_db.sort_index(inplace=True)
-                            
+                            # 更新内存中的数据：二分切掉当天旧行后直接拼接（有则替换、无则追加），
+                            # 前缀本身有序且当天行必然最新，拼接后无需整表重排
+                            cut = df_db.index.searchsorted(df_today.index[0])
+                            df_db = pd.concat([df_db.iloc[:cut], df_today])
+
                             logger.info(f"[{symbol}] 成功更新当天数据")
                         else:
                             logger.warning(f"[{symbol}] 当天数据异常，不更新")
@@ -209,26 +270,11 @@ def get_stock_daily(symbol: str):
     else:
         logger.info(f"[{symbol}] 数据库数据不完整，需要从外部API获取数据")
     
-    # 为AkShare配置请求重试策略
-    session = requests.Session()
-    retry_strategy = Retry(
-        total=3,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["HEAD", "GET", "OPTIONS"],
-        backoff_factor=1  # 指数退避
-    )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    
-    # 设置全局超时
-    session.timeout = 10  # 10秒超时
-    
     for attempt in range(3):  # 增加到3次重试
         try:
-            # 替换AkShare的默认会话
-            ak._session = session
-            
+            # 复用模块级持久会话（带重试策略）
+            _init_session()
+
             df_ak = ak.stock_zh_a_hist(
                 symbol=symbol,
                 period="daily",
@@ -237,38 +283,17 @@ def get_stock_daily(symbol: str):
                 adjust="qfq"
             )
             if not df_ak.empty:
-                # 重命名中文列
-                df_ak.rename(columns={
-                    '日期': 'date',
-                    '开盘': 'open',
-                    '最高': 'high',
-                    '最低': 'low',
-                    '收盘': 'close',
-                    '成交量': 'volume',      # 单位：手
-                    '成交额': 'amount',
-                    '涨跌幅': 'pct_chg',
-                    '换手率': 'turnover'
-                }, inplace=True)
-                df_ak['date'] = pd.to_datetime(df_ak['date'])
-                df_ak.set_index('date', inplace=True)
-                df_ak.sort_index(inplace=True)
-                # 转换成交量为“股”
-                df_ak['volume'] = df_ak['volume'] * 100
-                # 清洗异常值
-                df_ak = df_ak[
-                    (df_ak['close'] > 0.1) &
-                    (df_ak['close'] < 1000) &
-                    (df_ak['volume'] >= 0)
-                ]
+                # 规整为统一schema并清洗
+                df_ak = _normalize_history(df_ak, source='ak')
                 if len(df_ak) >= 100:
                     # 保存到数据库（保存完整数据，包括当天可能未收盘的数据）
-                    save_df = df_ak[['open', 'high', 'low', 'close', 'volume']].copy().reset_index()
+                    save_df = _to_save_frame(df_ak)
                     batch_insert_stock_data(save_df, symbol)
-                    
+
                     # 不再保存到本地缓存，数据已直接保存到数据库
-                    
+
                     # 返回完整数据
-                    return df_ak[['open', 'high', 'low', 'close', 'volume']].copy()
+                    return df_ak
                 else:
                     logger.warning(f"[{symbol}] AkShare 数据不足（{len(df_ak)} 条）")
         except Exception as e:
@@ -279,13 +304,12 @@ def get_stock_daily(symbol: str):
     # === 降级到 Baostock ===
     for attempt in range(3):  # Baostock 也增加重试次数
         try:
-            # 确保 Baostock 连接有效，如果失败则重新连接
-            if not _bs_initialized or not _init_baostock():
-                logger.warning(f"[{symbol}] Baostock 连接失败，尝试重新连接...")
-                if not _init_baostock():
-                    time.sleep(2)
-                    continue
-            
+            # 确保 Baostock 连接有效（已登录时直接复用）
+            if not _init_baostock():
+                logger.warning(f"[{symbol}] Baostock 连接失败")
+                time.sleep(2)
+                continue
+
             # 构造代码
             if symbol.startswith(('6', '9')):
                 code = f"sh.{symbol}"
@@ -310,41 +334,44 @@ def get_stock_daily(symbol: str):
                 time.sleep(1)
                 continue
             
-            data_list = []
+            # 边读边解析为定型数据：日期串 + float64矩阵，
+            # 跳过"字符串DataFrame → pd.to_numeric逐列转换"的中间过程
+            dates = []
+            rows = []
             while rs.next():
-                data_list.append(rs.get_row_data())
-            
-            if not data_list:
+                row = rs.get_row_data()  # date,open,high,low,close,volume,amount
+                try:
+                    vals = [float(x) for x in row[1:6]]
+                except ValueError:
+                    continue  # 空串/脏数据行，等价于原来的dropna
+                dates.append(row[0])
+                rows.append(vals)
+
+            if not dates:
                 logger.warning(f"[{symbol}] Baostock 无数据")
                 continue
 
-            df_bs = pd.DataFrame(data_list, columns=['date','open','high','low','close','volume','amount'])
-            df_bs['date'] = pd.to_datetime(df_bs['date'])
-            df_bs.set_index('date', inplace=True)
+            df_bs = pd.DataFrame(
+                np.array(rows, dtype=np.float64),
+                columns=['open', 'high', 'low', 'close', 'volume'],
+                index=pd.to_datetime(dates, format='%Y-%m-%d')
+            )
+            df_bs.index.name = 'date'
             df_bs.sort_index(inplace=True)
-            
-            # 转换数值类型
-            for col in ['open','high','low','close','volume','amount']:
-                df_bs[col] = pd.to_numeric(df_bs[col], errors='coerce')
-            df_bs.dropna(inplace=True)
-            
-            # 清洗
-            df_bs = df_bs[
-                (df_bs['close'] > 0.1) &
-                (df_bs['close'] < 1000) &
-                (df_bs['volume'] >= 0)
-            ]
-            
+            # 清洗异常值（与_normalize_history同一掩码）
+            mask = (df_bs['close'] > 0.1) & (df_bs['close'] < 1000) & (df_bs['volume'] >= 0)
+            df_bs = df_bs.loc[mask]
+
             if len(df_bs) >= 100:
                 # 保存到数据库
-                save_df = df_bs[['open', 'high', 'low', 'close', 'volume']].copy().reset_index()
+                save_df = _to_save_frame(df_bs)
                 batch_insert_stock_data(save_df, symbol)
                 logger.info(f"[{symbol}] 成功保存 {len(df_bs)} 条 Baostock 数据到数据库")
                 # 调试日志：输出返回数据的基本信息
                 logger.debug(f"[{symbol}] 返回 Baostock 数据形状: {df_bs.shape}")
-                logger.debug(f"[{symbol}] 返回 Baostock 数据后5行:\n{df_bs[['open', 'high', 'low', 'close', 'volume']].tail()}")
+                logger.debug(f"[{symbol}] 返回 Baostock 数据后5行:\n{df_bs.tail()}")
                 # 返回完整数据
-                return df_bs[['open', 'high', 'low', 'close', 'volume']].copy()
+                return df_bs
             else:
                 logger.warning(f"[{symbol}] Baostock 数据不足（{len(df_bs)} 条）")
                 continue
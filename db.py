@@ -1,15 +1,20 @@
 # 数据库操作模块
 import os
 import time
+import json
+import threading
 import logging
 from datetime import datetime
+from functools import lru_cache
 import pandas as pd
-from sqlalchemy import create_engine, Column, String, Float, Date, DateTime, Integer, BigInteger, MetaData, Table, Text
+from sqlalchemy import create_engine, Column, String, Float, Date, DateTime, Integer, BigInteger, LargeBinary, MetaData, Table, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import NullPool
-from sqlalchemy import text
-import bcrypt  # 用于密码哈希
+from sqlalchemy import text, event, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from passlib.context import CryptContext  # 密码哈希（bcrypt后端）
+import msgpack  # daily_values二进制序列化
 from trade_calendar import get_current_trading_day
 
 # 配置日志
@@ -27,15 +32,84 @@ DB_CONFIG = {
     'sqlite_path': os.getenv('SQLITE_PATH', 'stock_data.db')
 }
 
+# 批量写入单批行数，可按部署环境调整
+INSERT_CHUNKSIZE = int(os.getenv('INSERT_CHUNKSIZE', '10000'))
+
+
+@lru_cache(maxsize=8192)
+def _parse_ymd(s):
+    """缓存'%Y-%m-%d'日期串解析：strptime开销大，同一批结果里日期高度重复"""
+    return datetime.strptime(s, '%Y-%m-%d').date()
+
+
+@lru_cache(maxsize=8192)
+def _parse_timestamp(s):
+    """缓存完整时间戳串解析（兼容带/不带毫秒两种格式）"""
+    try:
+        return datetime.strptime(s, '%Y-%m-%d %H:%M:%S.%f')
+    except ValueError:
+        try:
+            return datetime.strptime(s, '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return pd.to_datetime(s).to_pydatetime()
+
+# 模块级预编译SQL：固定语句只构造一次text对象，SQLAlchemy编译缓存按同一对象直接命中
+# 取按日期倒序的第一行：一次B树定位，替代MAX(update_time)的整分区扫描
+_SELECT_LATEST_STOCK = text("SELECT date, update_time FROM stock_daily WHERE symbol = :symbol ORDER BY date DESC LIMIT 1")
+_DELETE_OLD_STOCK = text("DELETE FROM stock_daily WHERE symbol = :symbol AND date < :delete_date")
+
+
+@lru_cache(maxsize=64)
+def _cached_text(sql):
+    """动态拼接的查询按SQL文本缓存text对象（可选过滤组合有限，条数很小）"""
+    return text(sql)
+
+
+def _pack_daily_values(daily_values):
+    """daily_values打包为msgpack字节串；键统一转str（日期键可能是Timestamp）"""
+    if not daily_values:
+        return None
+    return msgpack.packb({str(k): v for k, v in daily_values.items()}, use_bin_type=True)
+
+
+def _unpack_daily_values(raw):
+    """
+    解包daily_values：新行是msgpack字节串，String列时代的历史行是JSON文本
+    （SQLite下也可能以bytes读回），单行解不开按空值处理，不影响其余行
+    """
+    if not raw:
+        return {}
+    if isinstance(raw, (bytes, bytearray)):
+        try:
+            return msgpack.unpackb(raw, raw=False)
+        except Exception:
+            pass  # 落到JSON兜底
+    try:
+        return json.loads(raw)
+    except Exception as e:
+        logger.warning(f"daily_values解包失败，按空值处理：{e}")
+        return {}
+
+
 # 创建数据库引擎
 if DB_CONFIG['db_type'] == 'mysql':
     DATABASE_URL = f"mysql+pymysql://{DB_CONFIG['username']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}?charset=utf8mb4"
 else:
     DATABASE_URL = f"sqlite:///{DB_CONFIG['sqlite_path']}"
 
-# 创建引擎，使用NullPool避免连接池问题
+# 创建引擎：QueuePool复用连接，避免每个请求重新建连
+# pre_ping剔除失效连接，recycle避开MySQL的wait_timeout断连
 try:
-    engine = create_engine(DATABASE_URL, poolclass=NullPool)
+    engine_kwargs = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '10')),
+        'max_overflow': 20,
+        'pool_pre_ping': True,
+        'pool_recycle': 3600
+    }
+    if DB_CONFIG['db_type'] == 'sqlite':
+        # SQLite连接跨线程复用需要关闭同线程检查
+        engine_kwargs['connect_args'] = {'check_same_thread': False}
+    engine = create_engine(DATABASE_URL, **engine_kwargs)
     Base = declarative_base()
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
     metadata = MetaData()
@@ -44,6 +118,107 @@ except Exception as e:
     logger.error(f"创建数据库引擎失败: {str(e)}")
     raise RuntimeError(f"Database connection failed: {e}")
 
+
+# ==============================
+# 📈 可选列式分析镜像（DuckDB）
+# ==============================
+# stock_daily的范围扫描（按symbol取整段历史）是典型列式负载；
+# 配置ANALYTICS_DB_PATH后写入会同步镜像到DuckDB，查询优先走列存
+ANALYTICS_DB_PATH = os.getenv('ANALYTICS_DB_PATH', '')
+_analytics_conn = None
+_analytics_lock = threading.Lock()
+if ANALYTICS_DB_PATH:
+    try:
+        import duckdb
+        _analytics_conn = duckdb.connect(ANALYTICS_DB_PATH)
+        _analytics_conn.execute("""
+            CREATE TABLE IF NOT EXISTS stock_daily (
+                symbol VARCHAR, date DATE, open DOUBLE, high DOUBLE, low DOUBLE,
+                close DOUBLE, volume BIGINT, update_time TIMESTAMP
+            )
+        """)
+        logger.info(f"DuckDB分析镜像已启用: {ANALYTICS_DB_PATH}")
+    except ImportError:
+        logger.warning("已配置ANALYTICS_DB_PATH但未安装duckdb，分析镜像不可用")
+
+
+def _mirror_to_analytics(df, symbol):
+    """
+    将写入stock_daily的数据同步镜像到DuckDB（先删同symbol同日期旧行再插入，等价upsert）
+    df需包含symbol/date/open/high/low/close/volume/update_time列；失败只记日志，不影响主库写入
+    """
+    if _analytics_conn is None:
+        return
+    try:
+        with _analytics_lock:
+            # DuckDB可直接把局部DataFrame当表引用（零拷贝注册）
+            _analytics_conn.execute(
+                "DELETE FROM stock_daily WHERE symbol = ? AND date IN (SELECT date FROM df)", [symbol]
+            )
+            _analytics_conn.execute(
+                "INSERT INTO stock_daily SELECT symbol, date, open, high, low, close, volume, update_time FROM df"
+            )
+    except Exception as e:
+        logger.warning(f"[{symbol}] DuckDB镜像写入失败: {str(e)[:100]}")
+
+
+# 已确认镜像覆盖完整的symbol集合（进程内，每个symbol只校验一次）
+_analytics_verified = set()
+
+
+def _mirror_is_complete(symbol):
+    """
+    校验镜像对该symbol的覆盖是否完整（行数不少于主库），不完整先整段回填
+    - 启用镜像前已入库的历史、或只镜像过当天增量的symbol，行数会少于主库；
+      若直接优先镜像查询，下游会拿到残缺"历史"而报数据不足
+    - 校验/回填失败返回False，调用方回落行存查询
+    """
+    if symbol in _analytics_verified:
+        return True
+    try:
+        with _analytics_lock:
+            mirror_cnt = _analytics_conn.execute(
+                "SELECT COUNT(*) FROM stock_daily WHERE symbol = ?", [symbol]
+            ).fetchone()[0]
+        with engine.connect() as conn:
+            primary_cnt = conn.execute(
+                _cached_text("SELECT COUNT(*) FROM stock_daily WHERE symbol = :symbol"),
+                {'symbol': symbol}
+            ).scalar()
+        if mirror_cnt < primary_cnt:
+            full = pd.read_sql(
+                _cached_text("SELECT * FROM stock_daily WHERE symbol = :symbol"),
+                con=engine, params={'symbol': symbol}
+            )
+            with _analytics_lock:
+                _analytics_conn.execute("DELETE FROM stock_daily WHERE symbol = ?", [symbol])
+                _analytics_conn.execute(
+                    "INSERT INTO stock_daily SELECT symbol, date, open, high, low, close, volume, update_time FROM full"
+                )
+            logger.info(f"[{symbol}] DuckDB镜像回填完成，共 {len(full)} 条")
+        _analytics_verified.add(symbol)
+        return True
+    except Exception as e:
+        logger.warning(f"[{symbol}] DuckDB镜像完整性校验失败，回落行存查询: {str(e)[:100]}")
+        return False
+
+
+if DB_CONFIG['db_type'] == 'sqlite':
+    @event.listens_for(engine, 'connect')
+    def _sqlite_pragmas(dbapi_conn, _):
+        """
+        每个新连接设置SQLite性能PRAGMA：
+        WAL把每次COMMIT的两次fsync变为一次顺序追加，且写入期间不阻塞读；
+        synchronous=NORMAL在WAL下足够安全；temp_store/mmap/cache减少临时落盘与系统调用
+        """
+        cur = dbapi_conn.cursor()
+        cur.execute('PRAGMA journal_mode=WAL')
+        cur.execute('PRAGMA synchronous=NORMAL')
+        cur.execute('PRAGMA temp_store=MEMORY')
+        cur.execute('PRAGMA mmap_size=268435456')   # 256MB
+        cur.execute('PRAGMA cache_size=-65536')     # 64MB页缓存
+        cur.close()
+
 # 股票数据模型
 class StockDaily(Base):
     __tablename__ = "stock_daily"
@@ -57,6 +232,9 @@ class StockDaily(Base):
     volume = Column(BigInteger, nullable=False)
     update_time = Column(DateTime, nullable=False, default=datetime.now)
 
+# check_data_completeness按symbol取MAX(update_time)，主键(symbol, date)覆盖不到update_time
+Index('ix_stock_daily_symbol_update', StockDaily.symbol, StockDaily.update_time.desc())
+
 # 预测结果模型
 class PredictResult(Base):
     __tablename__ = "predict_results"
@@ -79,6 +257,13 @@ class PredictResult(Base):
     created_at = Column(Date, nullable=False, default=datetime.now().date)
     update_time = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
 
+# query_predict_results/save_predict_result按(stock_code, predict_date)组合过滤；
+# 唯一索引同时作为批量upsert的冲突判定键
+Index('ix_predict_code_date', PredictResult.stock_code, PredictResult.predict_date, unique=True)
+
+# 与query_predict_results的ORDER BY predict_date DESC, id DESC对齐，按索引序扫描免排序
+Index('ix_predict_date_id', PredictResult.predict_date.desc(), PredictResult.id.desc())
+
 # 用户模型
 class User(Base):
     __tablename__ = "users"
@@ -119,10 +304,13 @@ class BacktestResult(Base):
     sharpe_ratio = Column(Float, nullable=False)
     win_rate_pct = Column(Float, nullable=False)
     total_trades = Column(Integer, nullable=False)
-    daily_values = Column(String, nullable=True)  # 使用JSON字符串存储日价值数据
+    daily_values = Column(LargeBinary, nullable=True)  # 使用msgpack二进制存储日价值数据
     created_at = Column(Date, nullable=False, default=datetime.now().date)
     update_time = Column(DateTime, nullable=False, default=datetime.now, onupdate=datetime.now)
 
+# 与query_backtest_results的ORDER BY created_at DESC, id DESC对齐，按索引序扫描免排序
+Index('ix_backtest_created_id', BacktestResult.created_at.desc(), BacktestResult.id.desc())
+
 # 创建数据库表
 def create_tables():
     """创建数据库表"""
@@ -142,17 +330,29 @@ def get_db():
     finally:
         db.close()
 
+# bcrypt成本因子，可按部署硬件调整（值+1耗时翻倍）
+BCRYPT_COST = int(os.getenv('BCRYPT_COST', '12'))
+
+# 模块级密码哈希上下文：成本配置只解析一次；
+# 新哈希用bcrypt_sha256（绕过bcrypt的72字节截断），历史bcrypt哈希仍可验证并自动标记升级
+_PWD_CTX = CryptContext(
+    schemes=['bcrypt_sha256', 'bcrypt'],
+    deprecated='auto',
+    bcrypt_sha256__rounds=BCRYPT_COST,
+    bcrypt__rounds=BCRYPT_COST
+)
+
 # 密码哈希函数
+# bcrypt单次哈希约百毫秒量级：main.py把注册/登录处理整体放进asyncio.to_thread，
+# 事件循环不会被阻塞，这里无需再提供异步包装
 def hash_password(password):
     """将密码进行哈希处理"""
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed.decode('utf-8')
+    return _PWD_CTX.hash(password)
 
 # 密码验证函数
 def verify_password(plain_password, hashed_password):
-    """验证密码是否匹配"""
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    """验证密码是否匹配（兼容历史bcrypt哈希）"""
+    return _PWD_CTX.verify(plain_password, hashed_password)
 
 # 创建新用户
 def create_user(db, username, password, email=None):
@@ -184,16 +384,14 @@ def create_user(db, username, password, email=None):
 # 验证用户
 def authenticate_user(db, username, password):
     """验证用户身份"""
-    # 首先尝试通过邮箱查找用户
-    user = db.query(User).filter(User.email == username).first()
-    
-    # 如果邮箱不存在，再尝试通过用户名查找（保持向后兼容性）
-    if not user:
-        user = db.query(User).filter(User.username == username).first()
-        
+    # 邮箱与用户名合并为一次OR查询（原先顺序发两条SELECT）
+    user = db.query(User).filter(or_(User.email == username, User.username == username)).first()
+
     if not user:
+        # 跑一次哑哈希验证，使"用户不存在"与"密码错误"的耗时一致，避免计时探测用户名
+        _PWD_CTX.dummy_verify()
         return False, None, "用户不存在"
-    
+
     if not verify_password(password, user.password):
         return False, None, "密码错误"
     
@@ -214,89 +412,44 @@ def batch_insert_stock_data(df, symbol):
         symbol: 股票代码
     """
     try:
-        # 确保日期格式正确
-        df['date'] = pd.to_datetime(df['date']).dt.date
-        
+        # 先裁剪到入库需要的列再复制：不改写调用方的DataFrame，
+        # 调用方带了额外列（指标、新闻等）时也只按瘦表做后续转换
+        df = df[['date', 'open', 'high', 'low', 'close', 'volume']].copy()
+
+        # 确保日期格式正确（cache=True对重复日期串只解析一次）
+        df['date'] = pd.to_datetime(df['date'], cache=True).dt.date
+
         # 添加股票代码和更新时间
         df['symbol'] = symbol
         # 设置更新时间为当前时间
         df['update_time'] = datetime.now()
-        
-        # 根据数据库类型选择不同的插入策略
+
+        records = df[['symbol', 'date', 'open', 'high', 'low', 'close', 'volume', 'update_time']].to_dict(orient='records')
+
+        # 方言原生upsert：一条语句完成插入/更新（当天未收盘数据会被覆盖更新），
+        # 不再经过"写临时表→INSERT...SELECT→DROP"的两次全量落盘
+        update_cols = ['open', 'high', 'low', 'close', 'volume', 'update_time']
         if DB_CONFIG['db_type'] == 'sqlite':
-            # 创建一个临时表
-            temp_table_name = 'temp_stock_daily'
-            
-            # 将数据先插入到临时表
-            df[['symbol', 'date', 'open', 'high', 'low', 'close', 'volume', 'update_time']].to_sql(
-                temp_table_name,
-                con=engine,
-                if_exists='replace',
-                index=False,
-                chunksize=1000
+            stmt = sqlite_insert(StockDaily.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['symbol', 'date'],
+                set_={col: stmt.excluded[col] for col in update_cols}
             )
-            
-            # 使用SQLite的INSERT OR REPLACE语句将临时表中的数据插入到正式表
-            # 这样可以更新已存在的数据（如当天未收盘的数据）
-            insert_query = text(f"""
-            INSERT OR REPLACE INTO stock_daily (symbol, date, open, high, low, close, volume, update_time)
-            SELECT symbol, date, open, high, low, close, volume, update_time FROM {temp_table_name}
-            """)
-            
-            with engine.connect() as conn:
-                result = conn.execute(insert_query)
-                conn.commit()
-                inserted_rows = result.rowcount
-            
-            # 删除临时表
-            drop_temp_query = text(f"DROP TABLE IF EXISTS {temp_table_name}")
-            with engine.connect() as conn:
-                conn.execute(drop_temp_query)
-                conn.commit()
         else:  # MySQL
-            # 对于MySQL，我们使用INSERT ... ON DUPLICATE KEY UPDATE语法
-            # 这样可以插入新数据并更新已存在的数据
-            
-            # 首先，创建一个临时表来存储数据
-            temp_table_name = f"stock_daily_temp_{symbol}_{int(time.time())}"
-            
-            # 将数据写入临时表
-            df.to_sql(
-                temp_table_name,
-                con=engine,
-                if_exists='replace',
-                index=False,
-                chunksize=1000
+            stmt = mysql_insert(StockDaily.__table__)
+            stmt = stmt.on_duplicate_key_update(
+                {col: stmt.inserted[col] for col in update_cols}
             )
-            
-            # 使用INSERT ... ON DUPLICATE KEY UPDATE语句将临时表中的数据插入到正式表
-            insert_query = text(f"""
-            INSERT INTO stock_daily (symbol, date, open, high, low, close, volume, update_time)
-            SELECT symbol, date, open, high, low, close, volume, update_time FROM {temp_table_name}
-            ON DUPLICATE KEY UPDATE
-                open = VALUES(open),
-                high = VALUES(high),
-                low = VALUES(low),
-                close = VALUES(close),
-                volume = VALUES(volume),
-                update_time = VALUES(update_time)
-            """)
-            
-            with engine.connect() as conn:
-                result = conn.execute(insert_query)
-                conn.commit()
-                inserted_rows = result.rowcount
-            
-            # 删除临时表
-            drop_temp_query = text(f"DROP TABLE IF EXISTS {temp_table_name}")
-            with engine.connect() as conn:
-                conn.execute(drop_temp_query)
-                conn.commit()
-            
-            # 如果没有新数据或更新的数据，inserted_rows可能为0
-            if inserted_rows == 0:
-                inserted_rows = 0
-        
+
+        inserted_rows = 0
+        with engine.begin() as conn:
+            for i in range(0, len(records), INSERT_CHUNKSIZE):
+                result = conn.execute(stmt, records[i:i + INSERT_CHUNKSIZE])
+                inserted_rows += result.rowcount
+
+        # 同步镜像到列式分析库（未启用时为空操作）
+        _mirror_to_analytics(df, symbol)
+
         if inserted_rows == 0:
             logger.info(f"[{symbol}] 没有新数据需要插入到数据库")
         else:
@@ -321,20 +474,45 @@ def query_stock_data(symbol, start_date=None, end_date=None):
         DataFrame: 股票历史数据
     """
     try:
-        # 构建查询语句
-        query = f"SELECT * FROM stock_daily WHERE symbol = '{symbol}'"
-        
+        # 优先走DuckDB列式镜像：按symbol的整段范围扫描是列存的强项
+        # （首次查询先校验镜像覆盖完整，必要时从主库回填，防止只镜像了增量的symbol返回残缺历史）
+        if _analytics_conn is not None and _mirror_is_complete(symbol):
+            duck_sql = "SELECT * FROM stock_daily WHERE symbol = ?"
+            duck_params = [symbol]
+            if start_date:
+                duck_sql += " AND date >= ?"
+                duck_params.append(start_date)
+            if end_date:
+                duck_sql += " AND date <= ?"
+                duck_params.append(end_date)
+            with _analytics_lock:
+                df = _analytics_conn.execute(duck_sql, duck_params).df()
+            if not df.empty:
+                df['date'] = pd.to_datetime(df['date'])
+                df.set_index('date', inplace=True)
+                df.sort_index(inplace=True)
+                df.drop(columns=['symbol'], inplace=True)
+                logger.info(f"[{symbol}] 从DuckDB镜像查询到 {len(df)} 条数据")
+                return df
+            # 镜像无该股票数据（启用前已入库），回落到行存查询
+
+        # 构建查询语句：绑定参数而非f-string拼接，语句文本固定可复用预编译计划
+        query = "SELECT * FROM stock_daily WHERE symbol = :symbol"
+        params = {'symbol': symbol}
+
         # 添加日期过滤条件
         if start_date:
-            query += f" AND date >= '{start_date}'"
+            query += " AND date >= :start_date"
+            params['start_date'] = start_date
         if end_date:
-            query += f" AND date <= '{end_date}'"
-        
-        # 执行查询
-        df = pd.read_sql(query, con=engine)
-        
+            query += " AND date <= :end_date"
+            params['end_date'] = end_date
+
+        # 执行查询：Arrow后端省去逐单元格Python装箱，长历史下内存占用明显更低
+        df = pd.read_sql(_cached_text(query), con=engine, params=params, dtype_backend='pyarrow')
+
         if not df.empty:
-            # 转换日期格式
+            # 日期列转回datetime64：下游按DatetimeIndex做searchsorted/isin切片
             df['date'] = pd.to_datetime(df['date'])
             # 设置日期为索引
             df.set_index('date', inplace=True)
@@ -365,44 +543,29 @@ def check_data_completeness(symbol, required_days=365, as_of_date=None):
         int: 现有数据天数
     """
     try:
-        # 查询最新日期和更新时间
-        query = f"SELECT MAX(date) as latest_date, MAX(update_time) as latest_update FROM stock_daily WHERE symbol = '{symbol}'"
-        latest_date_df = pd.read_sql(query, con=engine)
-        
-        if latest_date_df.empty or pd.isna(latest_date_df.iloc[0]['latest_date']):
+        # 查询最新日期和更新时间：直接取标量行，两个值不值得物化DataFrame
+        with engine.connect() as conn:
+            row = conn.execute(_SELECT_LATEST_STOCK, {'symbol': symbol}).first()
+
+        if row is None or row[0] is None:
             return False
-        # 判断latest_date_df.iloc[0]['latest_date']是否在上一个交易日收盘后更新的
-        latest_date = latest_date_df.iloc[0]['latest_date']
+        # 判断最新一行是否在上一个交易日收盘后更新的
+        latest_date = row[0]
+        if isinstance(latest_date, str):
+            latest_date = _parse_ymd(latest_date)
         # 判断latest_date是否是交易日
         if latest_date != get_current_trading_day():
             logger.info(f"{latest_date} 不是最新交易日")
             return False
 
-        latest_update = latest_date_df.iloc[0]['latest_update']
+        latest_update = row[1]
 
         logger.info(f"最近收盘时间为 {as_of_date}")
         
-        # 判断是否有as_of_date参数
-        if as_of_date:
-            # 确保as_of_date是时间戳类型
-            if isinstance(as_of_date, str):
-                try:
-                    as_of_date = datetime.strptime(as_of_date, '%Y-%m-%d %H:%M:%S')
-                except ValueError:
-                    as_of_date = pd.to_datetime(as_of_date)
-            elif not isinstance(as_of_date, datetime.datetime):
-                as_of_date = pd.to_datetime(as_of_date)
-            
-        # 确保latest_update是时间戳类型
-        if isinstance(latest_update, str):
-            try:
-                # 先尝试解析包含毫秒的格式
-                latest_update = datetime.strptime(latest_update, '%Y-%m-%d %H:%M:%S.%f')
-            except ValueError:
-                # 如果失败，再尝试解析不包含毫秒的格式
-                latest_update = datetime.strptime(latest_update, '%Y-%m-%d %H:%M:%S')
-        elif not isinstance(latest_update, datetime.datetime):
-            latest_update = pd.to_datetime(latest_update)
+        # 统一转为时间戳类型：字符串走缓存解析，其余类型交给pd.to_datetime自动分派
+        if as_of_date is not None:
+            as_of_date = _parse_timestamp(as_of_date) if isinstance(as_of_date, str) else pd.to_datetime(as_of_date)
+        latest_update = _parse_timestamp(latest_update) if isinstance(latest_update, str) else pd.to_datetime(latest_update)
 
         # 判断是否在最近的交易日收盘后更新的
         if as_of_date:
@@ -442,59 +605,59 @@ def save_predict_result(result):
             - drawdown_5d: 5日回撤
             - reason: 预测理由
     """
+    return save_predict_results_bulk([result])
+
+# 批量保存预测结果
+def save_predict_results_bulk(results):
+    """
+    批量保存预测结果：整批一条upsert语句、一次事务提交，
+    替代逐条"SELECT判存在→UPDATE/INSERT→commit"的N次往返与N次fsync
+
+    Args:
+        results: 预测结果字典列表，字段同save_predict_result
+    """
+    if not results:
+        return True
     try:
-        # 转换日期格式
-        predict_date = datetime.strptime(result['date'], '%Y-%m-%d').date()
-        
-        # 保存到数据库
-        db = SessionLocal()
-        
-        # 检查是否已经存在相同stock_code和predict_date的记录
-        existing_result = db.query(PredictResult).filter(
-            PredictResult.stock_code == result['stock_code'],
-            PredictResult.predict_date == predict_date
-        ).first()
-        
-        if existing_result:
-            # 更新现有记录
-            existing_result.stock_name = result['name']
-            existing_result.board = result['board']
-            existing_result.price = result['price']
-            existing_result.signal = result['signal']
-            existing_result.prob = result['prob']
-            existing_result.sentiment_label = result['sentiment_label']
-            existing_result.sentiment_score = result['sentiment_score']
-            existing_result.rsi = result['rsi']
-            existing_result.price_above_bb_upper = 'Y' if result['price_above_bb_upper'] else 'N'
-            existing_result.mom_weakening = 'Y' if result['mom_weakening'] else 'N'
-            existing_result.drawdown_5d = result['drawdown_5d']
-            existing_result.reason = result.get('reason', '')
-            # update_time会自动更新（因为模型中设置了onupdate属性）
-        else:
-            # 创建新记录
-            predict_result = PredictResult(
-                stock_code=result['stock_code'],
-                stock_name=result['name'],
-                board=result['board'],
-                price=result['price'],
-                signal=result['signal'],
-                prob=result['prob'],
-                sentiment_label=result['sentiment_label'],
-                sentiment_score=result['sentiment_score'],
-                rsi=result['rsi'],
-                price_above_bb_upper='Y' if result['price_above_bb_upper'] else 'N',
-                mom_weakening='Y' if result['mom_weakening'] else 'N',
-                drawdown_5d=result['drawdown_5d'],
-                reason=result.get('reason', ''),
-                predict_date=predict_date,
-                created_at=datetime.now().date()
+        rows = [{
+            'stock_code': r['stock_code'],
+            'stock_name': r['name'],
+            'board': r['board'],
+            'price': r['price'],
+            'signal': r['signal'],
+            'prob': r['prob'],
+            'sentiment_label': r['sentiment_label'],
+            'sentiment_score': r['sentiment_score'],
+            'rsi': r['rsi'],
+            'price_above_bb_upper': 'Y' if r['price_above_bb_upper'] else 'N',
+            'mom_weakening': 'Y' if r['mom_weakening'] else 'N',
+            'drawdown_5d': r['drawdown_5d'],
+            'reason': r.get('reason', ''),
+            'predict_date': _parse_ymd(r['date']),
+            'created_at': datetime.now().date()
+        } for r in results]
+
+        update_cols = ['stock_name', 'board', 'price', 'signal', 'prob',
+                       'sentiment_label', 'sentiment_score', 'rsi',
+                       'price_above_bb_upper', 'mom_weakening',
+                       'drawdown_5d', 'reason', 'update_time']
+        if DB_CONFIG['db_type'] == 'sqlite':
+            stmt = sqlite_insert(PredictResult.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['stock_code', 'predict_date'],
+                set_={col: stmt.excluded[col] for col in update_cols}
             )
-            db.add(predict_result)
-        
-        db.commit()
-        db.close()
-        
-        logger.info(f"预测结果已保存到数据库: {result['stock_code']} - {result['name']} ({result['date']})")
+        else:  # MySQL
+            stmt = mysql_insert(PredictResult.__table__)
+            stmt = stmt.on_duplicate_key_update(
+                {col: stmt.inserted[col] for col in update_cols}
+            )
+
+        with engine.begin() as conn:
+            for i in range(0, len(rows), INSERT_CHUNKSIZE):
+                conn.execute(stmt, rows[i:i + INSERT_CHUNKSIZE])
+
+        logger.info(f"预测结果已保存到数据库，共 {len(rows)} 条")
         return True
     except Exception as e:
         logger.error(f"保存预测结果到数据库失败: {str(e)}")
@@ -516,36 +679,40 @@ def query_predict_results(stock_code=None, predict_date=None, start_date=None, e
         list: 预测结果列表
     """
     try:
-        # 构建查询
+        # 构建查询（绑定参数，语句文本固定可复用预编译计划）
         query = "SELECT * FROM predict_results WHERE 1=1"
-        
+        params = {'limit': limit}
+
         # 添加过滤条件
         if stock_code:
-            query += f" AND stock_code = '{stock_code}'"
+            query += " AND stock_code = :stock_code"
+            params['stock_code'] = stock_code
         if predict_date:
-            query += f" AND predict_date = '{predict_date}'"
+            query += " AND predict_date = :predict_date"
+            params['predict_date'] = predict_date
         if start_date:
-            query += f" AND predict_date >= '{start_date}'"
+            query += " AND predict_date >= :start_date"
+            params['start_date'] = start_date
         if end_date:
-            query += f" AND predict_date <= '{end_date}'"
-        
+            query += " AND predict_date <= :end_date"
+            params['end_date'] = end_date
+
         # 添加排序和限制
-        query += " ORDER BY predict_date DESC, id DESC LIMIT ?"
-        
-        # 执行查询
-        df = pd.read_sql(query, con=engine, params=(limit,))
-        
-        if df.empty:
+        query += " ORDER BY predict_date DESC, id DESC LIMIT :limit"
+
+        # 执行查询：直接取行映射，省去DataFrame物化+dtype推断再转records的中间环节
+        with engine.connect() as conn:
+            rows = conn.execute(_cached_text(query), params).mappings().all()
+
+        if not rows:
             logger.info("未查询到预测结果")
             return []
-        
+
         # 转换数据类型
-        df['price_above_bb_upper'] = df['price_above_bb_upper'] == 'Y'
-        df['mom_weakening'] = df['mom_weakening'] == 'Y'
-        
-        # 转换为字典列表
-        results = df.to_dict('records')
-        
+        results = [{**row,
+                    'price_above_bb_upper': row['price_above_bb_upper'] == 'Y',
+                    'mom_weakening': row['mom_weakening'] == 'Y'} for row in rows]
+
         logger.info(f"查询到 {len(results)} 条预测结果")
         return results
     except Exception as e:
@@ -586,9 +753,8 @@ def delete_old_data(symbol, keep_days=1825):  # 保留5年数据
         delete_date = (datetime.now() - pd.Timedelta(days=keep_days)).strftime('%Y-%m-%d')
         
         # 执行删除
-        delete_query = f"DELETE FROM stock_daily WHERE symbol = '{symbol}' AND date < '{delete_date}'"
         with engine.connect() as conn:
-            result = conn.execute(delete_query)
+            result = conn.execute(_DELETE_OLD_STOCK, {'symbol': symbol, 'delete_date': delete_date})
             conn.commit()
             logger.info(f"[{symbol}] 删除了 {result.rowcount} 条旧数据")
             
@@ -597,10 +763,36 @@ def delete_old_data(symbol, keep_days=1825):  # 保留5年数据
         logger.error(f"[{symbol}] 删除旧数据失败: {str(e)}")
         return False
 
+def _ensure_indexes():
+    """
+    给升级前就已存在的表补建索引
+    - create_all只建缺失的表，不会给旧表补新索引；老库升级后若不补建，
+      唯一索引ix_predict_code_date缺失会让批量upsert的冲突判定直接失效
+      （SQLite报ON CONFLICT不匹配，MySQL静默堆重复行）
+    - 建唯一索引前先清理(stock_code, predict_date)的历史重复行，只保留最新id
+    """
+    try:
+        # 子查询包一层派生表，MySQL不允许DELETE时直接引用同一张表
+        with engine.begin() as conn:
+            conn.execute(text(
+                "DELETE FROM predict_results WHERE id NOT IN ("
+                "SELECT id FROM (SELECT MAX(id) AS id FROM predict_results "
+                "GROUP BY stock_code, predict_date) AS t)"
+            ))
+        # checkfirst逐个补建：已存在的跳过，幂等可重复执行
+        for table in (StockDaily.__table__, PredictResult.__table__, BacktestResult.__table__):
+            for idx in table.indexes:
+                idx.create(bind=engine, checkfirst=True)
+        logger.info("数据库索引检查/补建完成")
+    except Exception as e:
+        logger.error(f"补建数据库索引失败: {str(e)}")
+
+
 # 初始化数据库
 def init_db():
     """初始化数据库"""
     create_tables()
+    _ensure_indexes()
     logger.info("数据库初始化完成")
 
 # 保存回测结果到数据库
@@ -626,13 +818,13 @@ def save_backtest_result(result):
             - daily_values: 每日价值数据（字典格式）
     """
     try:
-        # 转换日期格式
-        start_date = datetime.strptime(result['start_date'], '%Y-%m-%d').date()
-        end_date = datetime.strptime(result['end_date'], '%Y-%m-%d').date()
-        
-        # 导入json模块用于处理daily_values
-        import json
+        # 转换日期格式（解析结果有缓存）
+        start_date = _parse_ymd(result['start_date'])
+        end_date = _parse_ymd(result['end_date'])
         
+        # daily_values打包为msgpack二进制（比JSON文本编码快且小40%左右）
+        packed_values = _pack_daily_values(result['daily_values'])
+
         # 保存到数据库
         db = SessionLocal()
         
@@ -655,7 +847,7 @@ def save_backtest_result(result):
             existing_result.sharpe_ratio = result['sharpe_ratio']
             existing_result.win_rate_pct = result['win_rate_pct']
             existing_result.total_trades = result['total_trades']
-            existing_result.daily_values = json.dumps(result['daily_values'])
+            existing_result.daily_values = packed_values
             # update_time会自动更新
         else:
             # 创建新记录
@@ -673,7 +865,7 @@ def save_backtest_result(result):
                 sharpe_ratio=result['sharpe_ratio'],
                 win_rate_pct=result['win_rate_pct'],
                 total_trades=result['total_trades'],
-                daily_values=json.dumps(result['daily_values']),
+                daily_values=packed_values,
                 created_at=datetime.now().date()
             )
             db.add(backtest_result)
@@ -702,35 +894,36 @@ def query_backtest_results(stock_code=None, start_date=None, end_date=None, limi
         list: 回测结果列表
     """
     try:
-        # 构建查询
+        # 构建查询（绑定参数，语句文本固定可复用预编译计划）
         query = "SELECT * FROM backtest_results WHERE 1=1"
-        
+        params = {'limit': limit}
+
         # 添加过滤条件
         if stock_code:
-            query += f" AND stock_code = '{stock_code}'"
+            query += " AND stock_code = :stock_code"
+            params['stock_code'] = stock_code
         if start_date:
-            query += f" AND start_date >= '{start_date}'"
+            query += " AND start_date >= :start_date"
+            params['start_date'] = start_date
         if end_date:
-            query += f" AND end_date <= '{end_date}'"
-        
+            query += " AND end_date <= :end_date"
+            params['end_date'] = end_date
+
         # 添加排序和限制
-        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
-        
-        # 执行查询
-        import json
-        df = pd.read_sql(query, con=engine, params=(limit,))
-        
-        if df.empty:
+        query += " ORDER BY created_at DESC, id DESC LIMIT :limit"
+
+        # 执行查询：直接取行映射，省去DataFrame物化+dtype推断再转records的中间环节
+        with engine.connect() as conn:
+            rows = conn.execute(_cached_text(query), params).mappings().all()
+
+        if not rows:
             logger.info("未查询到回测结果")
             return []
-        
-        # 转换daily_values从JSON字符串到字典
-        if 'daily_values' in df.columns:
-            df['daily_values'] = df['daily_values'].apply(lambda x: json.loads(x) if x else {})
-        
-        # 转换为字典列表
-        results = df.to_dict('records')
-        
+
+        # 解包daily_values（msgpack新行 + 历史JSON行兼容）
+        results = [{**row, 'daily_values': _unpack_daily_values(row['daily_values'])}
+                   for row in rows]
+
         logger.info(f"查询到 {len(results)} 条回测结果")
         return results
     except Exception as e:
@@ -746,41 +939,34 @@ def update_stock_list(df):
         df: 股票列表DataFrame，包含code和name字段
     """
     try:
-        db = SessionLocal()
-        
-        # 获取现有的股票代码列表
-        existing_codes = {row[0] for row in db.query(StockList.code).all()}
-        
-        # 处理每个股票
-        for _, row in df.iterrows():
-            code = row['code']
-            name = row['name']
-            
-            # 判断股票板块
-            if code.startswith('688'):
-                board = '科创板'
-            elif code.startswith('300'):
-                board = '创业板'
-            else:
-                board = '主板'
-            
-            if code in existing_codes:
-                # 更新现有记录
-                stock = db.query(StockList).filter(StockList.code == code).first()
-                if stock.name != name:
-                    stock.name = name
-                    stock.board = board
-                    logger.info(f"更新股票信息: {code} - {name}")
-            else:
-                # 创建新记录
-                new_stock = StockList(code=code, name=name, board=board)
-                db.add(new_stock)
-                existing_codes.add(code)
-                logger.info(f"新增股票: {code} - {name}")
-        
-        db.commit()
-        db.close()
-        
+        # 板块归属：3位前缀一次切片+字典映射，单趟C级字符串操作完成分类
+        df = df.copy()
+        df['board'] = df['code'].str.slice(0, 3).map({'688': '科创板', '300': '创业板'}).fillna('主板')
+        records = df[['code', 'name', 'board']].to_dict('records')
+
+        # 一条批量upsert替代"逐行SELECT再决定插入/更新"的ORM循环
+        if DB_CONFIG['db_type'] == 'sqlite':
+            stmt = sqlite_insert(StockList.__table__)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['code'],
+                set_={
+                    'name': stmt.excluded.name,
+                    'board': stmt.excluded.board,
+                    'update_time': stmt.excluded.update_time
+                }
+            )
+        else:  # MySQL
+            stmt = mysql_insert(StockList.__table__)
+            stmt = stmt.on_duplicate_key_update(
+                name=stmt.inserted.name,
+                board=stmt.inserted.board,
+                update_time=stmt.inserted.update_time
+            )
+
+        with engine.begin() as conn:
+            for i in range(0, len(records), INSERT_CHUNKSIZE):
+                conn.execute(stmt, records[i:i + INSERT_CHUNKSIZE])
+
         logger.info(f"股票列表更新完成，共处理 {len(df)} 支股票")
         return True
     except Exception as e:
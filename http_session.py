@@ -0,0 +1,30 @@
+# http_session.py
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# ==============================
+# 🌐 AkShare共享HTTP会话
+# ==============================
+# 模块级构建一次，供data_fetch/stock_utils/trade_calendar共用：
+# keep-alive连接复用 + 失败自动重试，连接池按并发扫描的量级配置
+_RETRY = Retry(
+    total=3,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=["HEAD", "GET", "OPTIONS"],
+    backoff_factor=0.3  # 指数退避
+)
+
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=_RETRY))
+SESSION.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=_RETRY))
+# 设置全局超时
+SESSION.timeout = 10  # 10秒超时
+
+
+def init_akshare_session():
+    """
+    将AkShare的默认会话替换为共享持久会话
+    """
+    import akshare as ak
+    ak._session = SESSION
@@ -1,18 +1,26 @@
 # main.py
+import asyncio
+import concurrent.futures
+import datetime
+import hashlib
+import json
 import logging
 import os
+import random
+from functools import lru_cache, partial
 from typing import Optional
-from fastapi import FastAPI, HTTPException, Query
+import orjson
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, Response
+from fastapi.responses import FileResponse, Response, ORJSONResponse
 from models import PredictRequest, PredictResponse, ScanRequest, BacktestRequest, BacktestResponse, HistoryPredictRequest, HistoryPredictListResponse, UserRegisterRequest, UserLoginRequest, UserResponse, AuthResponse
-from predict import predict_signal
-from stock_utils import get_all_stocks, get_market_board
+from predict import predict_signal, predict_from_df
+from stock_utils import get_all_stocks, get_market_board_vec, get_code_index
 from backtest import backtest_ai_strategy_cached
 from scheduler import start_scheduled_tasks
-from data_fetch import _logout_baostock
-from db import query_predict_results, init_db, get_db, create_user, authenticate_user, User
+from data_fetch import get_stock_daily, _logout_baostock
+from db import query_predict_results, save_predict_results_bulk, init_db, get_db, create_user, authenticate_user, User
 
 # 配置logging
 logging.basicConfig(
@@ -25,10 +33,63 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# /scan专用进程池：predict_signal是CPU密集的LightGBM训练，进程级并行绕开GIL
+_scan_pool = concurrent.futures.ProcessPoolExecutor(max_workers=os.cpu_count())
+
+# ========== Redis预测缓存（可选） ==========
+# 设置REDIS_URL环境变量后启用：同一交易日内对同一股票的重复/predict直接命中缓存，
+# 跳过整个"拉数据+算特征+训练+预测"链路
+REDIS_URL = os.getenv('REDIS_URL')
+_redis = None
+if REDIS_URL:
+    try:
+        import redis.asyncio as aioredis
+        _redis = aioredis.from_url(REDIS_URL)
+        logger.info("Redis预测缓存已启用")
+    except Exception as _e:
+        logger.warning(f"Redis初始化失败，预测缓存关闭: {_e}")
+        _redis = None
+
+# 盘中数据还在变，缓存短一些；收盘后当天结果不再变化，可以缓存到第二天
+_PREDICT_TTL_TRADING = 900
+_PREDICT_TTL_OFFHOURS = 86400
+
+def _is_trading_hours():
+    """是否在A股交易时段（9:30-11:30, 13:00-15:00）"""
+    now = datetime.datetime.now()
+    now_min = now.hour * 60 + now.minute
+    return (570 <= now_min <= 690) or (780 <= now_min <= 900)
+
+async def cached_predict(symbol, name):
+    """predict_signal的cache-aside封装：Redis命中直接返回，未命中算完回填"""
+    if _redis is None:
+        return await asyncio.to_thread(predict_signal, symbol, name)
+
+    key = f"v1:predict:{symbol}:{datetime.date.today().isoformat()}"
+    ttl_full = _PREDICT_TTL_TRADING if _is_trading_hours() else _PREDICT_TTL_OFFHOURS
+    try:
+        blob = await _redis.get(key)
+        if blob is not None:
+            ttl = await _redis.ttl(key)
+            # 概率性提前刷新：临近过期时让少量请求穿透重算，避免过期瞬间的集中击穿
+            if not (0 <= ttl < ttl_full * 0.2 and random.random() < 0.2):
+                return json.loads(blob)
+    except Exception as e:
+        logger.warning(f"读取预测缓存失败: {e}")
+
+    res = await asyncio.to_thread(predict_signal, symbol, name)
+    if res is not None:
+        try:
+            await _redis.set(key, json.dumps(res), ex=ttl_full)
+        except Exception as e:
+            logger.warning(f"写入预测缓存失败: {e}")
+    return res
+
 app = FastAPI(
     title="AI Stock Screener API",
     description="提供个股预测、全市场扫描、策略回测等服务",
     version="1.0.0",
+    default_response_class=ORJSONResponse,  # orjson编码比标准json快数倍，大列表响应收益明显
     docs_url="/docs",
     redoc_url="/redoc",
     openapi_url="/openapi.json"
@@ -55,7 +116,6 @@ async def startup_event():
 
 @app.on_event("shutdown")
 def shutdown_event():
-    from utils import _logout_baostock
     _logout_baostock()
 
 # 健康检查接口
@@ -63,50 +123,85 @@ def shutdown_event():
 async def health_check():
     return {"message": "AI Stock Screener API is running"}
 
+# index.html进程启动时读入内存并计算ETag：每次GET /不再同步读盘，浏览器重访直接304
+with open("index.html", "rb") as _f:
+    _INDEX_BYTES = _f.read()
+_INDEX_ETAG = hashlib.md5(_INDEX_BYTES).hexdigest()
+
+def _index_response(request: Request) -> Response:
+    if request.headers.get("if-none-match") == _INDEX_ETAG:
+        return Response(status_code=304)
+    return Response(
+        content=_INDEX_BYTES,
+        media_type="text/html",
+        headers={"ETag": _INDEX_ETAG, "Cache-Control": "public, max-age=60"}
+    )
+
 # 根路径提供H5页面
 @app.get("/")
-async def read_root():
-    with open("index.html", "r", encoding="utf-8") as f:
-        html_content = f.read()
-    return Response(content=html_content, media_type="text/html")
+async def read_root(request: Request):
+    return _index_response(request)
 
 # 同时支持直接访问index.html
 @app.get("/index.html")
-async def read_index():
-    with open("index.html", "r", encoding="utf-8") as f:
-        html_content = f.read()
-    return Response(content=html_content, media_type="text/html")
+async def read_index(request: Request):
+    return _index_response(request)
+
+# 同步DB操作的线程封装：会话的创建/查询/关闭都在工作线程内完成，事件循环不被阻塞
+def _do_register(username, password, email):
+    """在工作线程中执行注册流程，返回(success, message, user_response)"""
+    db = next(get_db())
+    try:
+        success, message = create_user(db, username, password, email)
+        user_response = None
+        if success:
+            # 获取创建的用户信息（在会话关闭前取出字段）
+            user = db.query(User).filter(User.username == username).first()
+            user_response = UserResponse(
+                id=user.id,
+                username=user.username,
+                email=user.email,
+                created_at=user.created_at.strftime("%Y-%m-%d")
+            )
+        return success, message, user_response
+    finally:
+        db.close()
+
+def _do_login(username, password):
+    """在工作线程中执行登录验证，返回(success, message, user_response)"""
+    db = next(get_db())
+    try:
+        success, user, message = authenticate_user(db, username, password)
+        user_response = None
+        if success and user:
+            user_response = UserResponse(
+                id=user.id,
+                username=user.username,
+                email=user.email,
+                created_at=user.created_at.strftime("%Y-%m-%d")
+            )
+        return success, message, user_response
+    finally:
+        db.close()
 
 # 用户注册接口
 @app.post("/register", response_model=AuthResponse, summary="用户注册", description="创建新用户账号")
 async def register_user(req: UserRegisterRequest):
     """
     创建新用户账号
-    
+
     - **username**: 用户名（必填）
     - **password**: 密码（必填）
     - **email**: 电子邮箱（可选）
-    
+
     返回注册结果信息
     """
     logger.info("收到用户注册请求，用户名：%s", req.username)
-    
-    # 获取数据库会话
-    db = next(get_db())
+
     try:
-        success, message = create_user(db, req.username, req.password, req.email)
-        if success:
-            # 获取创建的用户信息
-            user = db.query(User).filter(User.username == req.username).first()
-            user_response = UserResponse(
-                id=user.id,
-                username=user.username,
-                email=user.email,
-                created_at=user.created_at.strftime("%Y-%m-%d")
-            )
-            return AuthResponse(success=True, message=message, user=user_response)
-        else:
-            return AuthResponse(success=False, message=message)
+        success, message, user_response = await asyncio.to_thread(
+            _do_register, req.username, req.password, req.email)
+        return AuthResponse(success=success, message=message, user=user_response)
     except Exception as e:
         logger.error("用户注册失败：%s", str(e))
         return AuthResponse(success=False, message="注册失败，请稍后重试")
@@ -116,28 +211,18 @@ async def register_user(req: UserRegisterRequest):
 async def login_user(req: UserLoginRequest):
     """
     用户账号登录验证
-    
+
     - **username**: 用户名（必填）
     - **password**: 密码（必填）
-    
+
     返回登录结果信息和用户数据
     """
     logger.info("收到用户登录请求，用户名：%s", req.username)
-    
-    # 获取数据库会话
-    db = next(get_db())
+
     try:
-        success, user, message = authenticate_user(db, req.username, req.password)
-        if success and user:
-            user_response = UserResponse(
-                id=user.id,
-                username=user.username,
-                email=user.email,
-                created_at=user.created_at.strftime("%Y-%m-%d")
-            )
-            return AuthResponse(success=True, message=message, user=user_response)
-        else:
-            return AuthResponse(success=False, message=message)
+        success, message, user_response = await asyncio.to_thread(
+            _do_login, req.username, req.password)
+        return AuthResponse(success=success, message=message, user=user_response)
     except Exception as e:
         logger.error("用户登录失败：%s", str(e))
         return AuthResponse(success=False, message="登录失败，请稍后重试")
@@ -168,15 +253,9 @@ async def predict_stock(req: PredictRequest):
         if req.name:
             name = req.name
         else:
-            # 从股票数据库中查询真实的股票名称
+            # 从代码索引中O(1)查询真实的股票名称（找不到时退回股票代码）
             try:
-                stocks_df = get_all_stocks()
-                stock_row = stocks_df[stocks_df['code'] == symbol]
-                if not stock_row.empty:
-                    name = stock_row.iloc[0]['name']
-                else:
-                    # 如果找不到，使用股票代码作为默认名称
-                    name = symbol
+                name = get_code_index().get(symbol, (symbol, None))[0]
             except Exception as e:
                 logger.warning(f"获取股票 {symbol} 的名称失败：{e}")
                 # 异常情况下使用股票代码作为默认名称
@@ -209,12 +288,28 @@ async def predict_stock(req: PredictRequest):
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"查找股票名称时发生错误: {str(e)}")
     
-    result = predict_signal(symbol, name)
+    result = await cached_predict(symbol, name)
     if result is None:
         raise HTTPException(status_code=400, detail="数据不足或股票代码无效")
     
     return result
 
+def _stock_records(stocks_df):
+    """DataFrame -> [{code, name, board}]：板块整列向量化判定，zip拼装，避免iterrows逐行生成Series"""
+    boards = get_market_board_vec(stocks_df['code'])
+    return [{"code": c, "name": n, "board": b}
+            for c, n, b in zip(stocks_df['code'].tolist(), stocks_df['name'].tolist(), boards.tolist())]
+
+# 空关键词的完整列表每天只序列化一次，之后直接回放字节
+_stocks_full_cache = {"date": None, "body": b""}
+
+@lru_cache(maxsize=1024)
+def _stocks_search(q, today):
+    """按(关键词, 日期)缓存搜索结果，股票列表换天后自动失效"""
+    stocks_df = get_all_stocks()
+    stocks_df = stocks_df[(stocks_df['code'].str.contains(q)) | (stocks_df['name'].str.contains(q, case=False, na=False))]
+    return _stock_records(stocks_df)
+
 @app.get("/stocks", summary="获取股票列表", description="获取所有A股股票的代码和名称列表，用于前端搜索功能")
 async def get_stocks_list(q: Optional[str] = Query(None, description="搜索关键词，支持股票代码或名称模糊匹配")):
     """
@@ -225,22 +320,18 @@ async def get_stocks_list(q: Optional[str] = Query(None, description="搜索关
     返回包含股票代码和名称的列表
     """
     logger.info("收到股票列表请求，搜索关键词：%s", q)
-    stocks_df = get_all_stocks()
-    
-    # 如果有搜索关键词，进行过滤
-    if q:
-        stocks_df = stocks_df[(stocks_df['code'].str.contains(q)) | (stocks_df['name'].str.contains(q, case=False, na=False))]
-    
-    # 转换为响应格式
-    results = []
-    for _, row in stocks_df.iterrows():
-        results.append({
-            "code": row['code'],
-            "name": row['name'],
-            "board": get_market_board(row['code'])
-        })
-    
-    return {"stocks": results}
+    today = datetime.date.today()
+
+    # 空关键词（最常见）：直接返回当天预编码好的完整响应体
+    if not q:
+        if _stocks_full_cache["date"] != today:
+            _stocks_full_cache["body"] = orjson.dumps({"stocks": _stock_records(get_all_stocks())})
+            _stocks_full_cache["date"] = today
+            _stocks_search.cache_clear()  # 股票列表换天刷新，搜索缓存一并失效
+        return Response(_stocks_full_cache["body"], media_type="application/json")
+
+    # 搜索路径走LRU，同一天同关键词免重复扫描
+    return ORJSONResponse({"stocks": _stocks_search(q, today)})
 
 @app.post("/scan", summary="全市场扫描", description="扫描全市场股票，筛选出符合条件的股票")
 async def scan_stocks(req: ScanRequest):
@@ -254,20 +345,37 @@ async def scan_stocks(req: ScanRequest):
     返回符合条件的股票列表
     """
     logger.info("收到全市场扫描请求，板块：%s，最大数量：%s，最小概率：%s", req.board, req.max_count, req.min_prob)
-    stocks_df = get_all_stocks()
-    if req.board != "全部":
-        stocks_df = stocks_df[stocks_df['code'].apply(get_market_board) == req.board]
-
-    results = []
-    for _, row in stocks_df.iterrows():
-        if len(results) >= req.max_count:
-            break
-        res = predict_signal(row['code'], row['name'])
-        if res and res["prob"] >= req.min_prob:
-            results.append(res)
-        if len(results) >= 100:  # 安全上限
-            break
+    # 直接用代码索引按板块筛选，避免对DataFrame做apply+布尔过滤
+    targets = [(code, name) for code, (name, board) in get_code_index().items()
+               if req.board == "全部" or board == req.board]
+
+    # I/O与CPU分离调度：行情获取是等待型任务走线程（信号量限流，防止打爆外部API），
+    # 特征+训练+推理是CPU型任务进进程池绕开GIL
+    loop = asyncio.get_running_loop()
+    fetch_sem = asyncio.Semaphore(64)
+
+    async def _scan_one(code, name):
+        async with fetch_sem:
+            df = await asyncio.to_thread(get_stock_daily, code)
+        if df is None or df.empty:
+            return None
+        # cheap_filter: 必然"减仓"的股票先用廉价规则排除，省掉它们的模型训练
+        # save=False: 不在工作进程里逐条COMMIT，扫描完由这里批量入库
+        return await loop.run_in_executor(
+            _scan_pool, partial(predict_from_df, df, code, name, cheap_filter=True, save=False))
+
+    raw_results = await asyncio.gather(*[_scan_one(code, name) for code, name in targets],
+                                       return_exceptions=True)
+
+    all_results = [r for r in raw_results if isinstance(r, dict)]
+    # 一次事务批量保存全部预测结果，替代每个符号一次COMMIT
+    if all_results:
+        try:
+            await asyncio.to_thread(save_predict_results_bulk, all_results)
+        except Exception as e:
+            logger.error(f"批量保存扫描预测结果失败：{e}")
 
+    results = [r for r in all_results if r["prob"] >= req.min_prob]
     results.sort(key=lambda x: x["prob"], reverse=True)
     return {"stocks": results[:req.max_count]}
 
@@ -311,8 +419,9 @@ async def get_history_predictions(req: HistoryPredictRequest):
     """
     logger.info(f"收到历史预测查询请求，参数：{req}")
     try:
-        # 查询历史预测结果
-        results = query_predict_results(
+        # 查询历史预测结果（DB访问放到工作线程，避免阻塞事件循环）
+        results = await asyncio.to_thread(
+            query_predict_results,
             stock_code=req.stock_code,
             predict_date=req.predict_date,
             start_date=req.start_date,
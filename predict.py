@@ -1,12 +1,12 @@
 # predict.py
 import pandas as pd
 import numpy as np
-import time
+from numpy.lib.stride_tricks import sliding_window_view
 import warnings
 import logging
+from collections import OrderedDict
 from datetime import datetime
 import os
-import pickle
 
 # 配置logging
 logger = logging.getLogger(__name__)
@@ -16,13 +16,12 @@ os.environ['AKSHARE_HEADERS'] = '{"User-Agent": "Mozilla/5.0 (Windows NT 10.0; W
 warnings.filterwarnings('ignore')
 
 try:
-    import akshare as ak
     from lightgbm import LGBMClassifier
     from sklearn.utils.class_weight import compute_class_weight
     from db import save_predict_result, query_predict_results
     from data_fetch import get_stock_daily
     from stock_utils import get_market_board, analyze_stock_sentiment
-    from trade_calendar import is_trading_day, is_trading_hours, get_next_trading_day
+    from trade_calendar import get_next_trading_day
 except ImportError as e:
     raise RuntimeError(f"Missing dependency: {e}")
 
@@ -30,11 +29,37 @@ except ImportError as e:
 _predict_cache = {}
 _last_predict_update = {}
 
+# 已训练模型缓存：(symbol, 最新数据日, 训练窗口) -> 已fit的Booster
+# 同一交易日内/scan与/predict重复命中同一只股票时跳过重训
+_model_cache = OrderedDict()
+_MODEL_CACHE_MAX = 2000
+
+# 特征矩阵缓存：(symbol, 最新数据日) -> calc_features_vectorized(df)
+# 定时任务、/scan、/predict命中同一只股票时共享一次特征计算
+_feat_cache = OrderedDict()
+_FEAT_CACHE_MAX = 5000
+
 # 定时任务标志
 _predict_refreshing = False
 
 # 缓存文件路径定义
 PREDICT_CACHE_FILE = 'predict_cache.pkl'
+# 预测缓存的Parquet快照：1小时内的冷启动直接读文件，跳过数据库查询
+PREDICT_CACHE_PARQUET_FILE = 'predict_cache.parquet'
+
+# 预测理由模板：模块级常量，热路径里只做format，不重复构造f-string
+_REASON_PROB_HIGH = "AI模型预测上涨概率为{}%，属于较高水平"
+_REASON_PROB_MID = "AI模型预测上涨概率为{}%，属于中性偏上水平"
+_REASON_PROB_LOW = "AI模型预测上涨概率为{}%，属于较低水平"
+_REASON_RSI_OVERBOUGHT = "RSI指标为{}，处于超买区域，短期上涨压力较大"
+_REASON_RSI_OVERSOLD = "RSI指标为{}，处于超卖区域，短期下跌空间有限"
+_REASON_RSI_OK = "RSI指标为{}，处于合理区间，具有上涨潜力"
+_REASON_ABOVE_BB = "价格突破布林带上轨，短期可能面临回调压力"
+_REASON_MOM_WEAK = "动量正在减弱，上涨动能不足"
+_REASON_MOM_OK = "动量保持稳定，上涨动能充足"
+_REASON_DRAWDOWN = "5日回撤达到{}%，短期调整幅度较大"
+_REASON_SENTI_POS = "市场情绪为{}，有利于股价上涨"
+_REASON_SENTI_NEG = "市场情绪为{}，不利于股价上涨"
 
 
 # ==============================
@@ -46,34 +71,42 @@ def load_predict_cache():
     """
     global _predict_cache, _last_predict_update
     try:
-        # 从数据库加载最近的预测结果
-        results = query_predict_results(limit=1000)  # 加载最近1000条预测结果
-        if results:
-            # 转换为缓存格式
-            _predict_cache = {}
-            _last_predict_update = {}
-            for result in results:
-                symbol = result['stock_code']
-                _predict_cache[symbol] = {
-                    'name': result['stock_name'],
-                    'stock_code': result['stock_code'],
-                    'board': result['board'],
-                    'price': result['price'],
-                    'signal': result['signal'],
-                    'prob': result['prob'],
-                    'sentiment_label': result['sentiment_label'],
-                    'sentiment_score': result['sentiment_score'],
-                    'date': result['predict_date'].strftime('%Y-%m-%d') if hasattr(result['predict_date'], 'strftime') else result['predict_date'],
-                    'rsi': result['rsi'],
-                    'price_above_bb_upper': result['price_above_bb_upper'],
-                    'mom_weakening': result['mom_weakening'],
-                    'drawdown_5d': result['drawdown_5d']
-                }
-                _last_predict_update[symbol] = datetime.now().timestamp()
-            logger.info(f"从数据库加载预测结果成功，共 {len(_predict_cache)} 条数据")
-            return True
+        now_ts = datetime.now().timestamp()
+        df = None
+
+        # 1小时内的Parquet快照直接读，跳过数据库查询
+        if os.path.exists(PREDICT_CACHE_PARQUET_FILE) and now_ts - os.path.getmtime(PREDICT_CACHE_PARQUET_FILE) < 3600:
+            try:
+                df = pd.read_parquet(PREDICT_CACHE_PARQUET_FILE)
+            except Exception as e:
+                logger.warning(f"读取预测缓存Parquet快照失败，回退数据库：{e}")
+
+        if df is None:
+            # 从数据库加载最近1000条预测结果，整表列式转换替代逐行重组dict
+            results = query_predict_results(limit=1000)
+            if not results:
+                return False
+            df = pd.DataFrame(results)
+            df['date'] = pd.to_datetime(df['predict_date']).dt.strftime('%Y-%m-%d')
+            df = df.rename(columns={'stock_name': 'name'})
+            df = df[['stock_code', 'name', 'board', 'price', 'signal', 'prob',
+                     'sentiment_label', 'sentiment_score', 'date', 'rsi',
+                     'price_above_bb_upper', 'mom_weakening', 'drawdown_5d']]
+            # 落Parquet快照，供下次冷启动直接读
+            try:
+                df.to_parquet(PREDICT_CACHE_PARQUET_FILE)
+            except Exception as e:
+                logger.warning(f"保存预测缓存Parquet快照失败：{e}")
+
+        # 最近1000条会横跨多个predict_date，同一股票只留最新一行
+        # （查询按predict_date DESC排序，keep='first'即最新；索引不唯一时to_dict('index')会直接抛错）
+        df = df.drop_duplicates('stock_code', keep='first')
+        _predict_cache = df.set_index('stock_code', drop=False).to_dict('index')
+        _last_predict_update = dict.fromkeys(_predict_cache, now_ts)
+        logger.info(f"加载预测结果缓存成功，共 {len(_predict_cache)} 条数据")
+        return True
     except Exception as e:
-        logger.error(f"加载数据库预测结果缓存失败：{e}")
+        logger.error(f"加载预测结果缓存失败：{e}")
     return False
 
 
@@ -119,11 +152,13 @@ def calc_features_safe(df_slice):
         features['rsi_14'] = 50
 
     if len(close) >= 26:
-        ema12 = close.ewm(span=12, adjust=False).mean().iloc[-1]
-        ema26 = close.ewm(span=26, adjust=False).mean().iloc[-1]
-        dif = ema12 - ema26
-        dif_series = close.ewm(span=12).mean() - close.ewm(span=26).mean()
-        dea = dif_series.tail(9).mean()
+        # EMA只算一次并复用；DEA是DIF的9日EMA（标准MACD定义），
+        # 原实现用不同adjust参数把EMA算了两遍，且DEA用的是简单均值
+        ema12 = close.ewm(span=12, adjust=False).mean()
+        ema26 = close.ewm(span=26, adjust=False).mean()
+        dif_series = ema12 - ema26
+        dif = dif_series.iloc[-1]
+        dea = dif_series.ewm(span=9, adjust=False).mean().iloc[-1]
         hist = (dif - dea) * 2
         features['macd_dif'] = dif
         features['macd_dea'] = dea
@@ -151,21 +186,150 @@ def calc_features_safe(df_slice):
     return pd.Series(features)
 
 
-def predict_signal(symbol, name, train_window=200):
+def _rolling_mean(arr, window):
+    """
+    基于sliding_window_view的滚动均值（零拷贝窗口视图），前window-1位为NaN
+    """
+    out = np.full(arr.shape, np.nan)
+    out[window - 1:] = sliding_window_view(arr, window).mean(axis=1)
+    return out
+
+
+def _rolling_std(arr, window):
+    """
+    基于sliding_window_view的滚动标准差（ddof=1，与pandas一致），前window-1位为NaN
+    """
+    out = np.full(arr.shape, np.nan)
+    out[window - 1:] = sliding_window_view(arr, window).std(axis=1, ddof=1)
+    return out
+
+
+def calc_features_vectorized(df):
+    """
+    向量化计算全量特征矩阵
+    - df: 完整的日线数据（index=datetime, columns含open/high/low/close/volume）
+
+    返回与df.index对齐的特征DataFrame，第i行等价于calc_features_safe(df.iloc[:i+1])的结果。
+    滚动窗口统计基于sliding_window_view的零拷贝视图一次算完，
+    避免训练循环中O(N²)的重复计算。前60行因窗口不足会包含NaN，
+    调用方应只使用第60行之后的数据。
+    """
+    if len(df) < 60:
+        return None
+
+    close = df['close'].to_numpy(dtype=np.float64)
+    volume = df['volume'].to_numpy(dtype=np.float64)
+
+    feats = pd.DataFrame(index=df.index)
+    mom_5 = np.full(close.shape, np.nan)
+    mom_5[5:] = close[5:] / close[:-5] - 1
+    mom_20 = np.full(close.shape, np.nan)
+    mom_20[20:] = close[20:] / close[:-20] - 1
+    feats['mom_5'] = mom_5
+    feats['mom_20'] = mom_20
+
+    ma5 = _rolling_mean(close, 5)
+    ma20 = _rolling_mean(close, 20)
+    ma60 = _rolling_mean(close, 60)
+    feats['ma5'] = ma5
+    feats['ma20'] = ma20
+    feats['ma60'] = ma60
+    feats['ma_align'] = ((ma5 > ma20) & (ma20 > ma60)).astype(int)
+    feats['price_to_ma20'] = (close - ma20) / ma20
+
+    # RSI（与calc_features_safe相同的简化算法：14日涨跌幅均值）
+    delta = np.full(close.shape, np.nan)
+    delta[1:] = np.diff(close)
+    gain = _rolling_mean(np.where(delta > 0, delta, 0.0), 14)
+    loss = _rolling_mean(np.where(delta < 0, -delta, 0.0), 14)
+    rs = np.where(loss != 0, gain / loss, 0.0)
+    feats['rsi_14'] = np.where(rs != 0, 100 - (100 / (1 + rs)), 50.0)
+
+    # MACD（ewm无固定窗口，仍用pandas计算）：EMA各算一次，DEA取DIF的9日EMA（标准定义）
+    close_s = df['close']
+    dif_series = close_s.ewm(span=12, adjust=False).mean() - close_s.ewm(span=26, adjust=False).mean()
+    dif = dif_series.to_numpy()
+    dea = dif_series.ewm(span=9, adjust=False).mean().to_numpy()
+    hist = (dif - dea) * 2
+    feats['macd_dif'] = dif
+    feats['macd_dea'] = dea
+    feats['macd_hist'] = hist
+    feats['macd_bullish'] = (hist > 0).astype(int)
+
+    vol_ma5 = _rolling_mean(volume, 5)
+    feats['vol_ratio_5'] = np.where(vol_ma5 != 0, volume / vol_ma5, 1.0)
+
+    # 布林带
+    bb_std = _rolling_std(close, 20)
+    bb_upper = ma20 + 2 * bb_std
+    bb_lower = ma20 - 2 * bb_std
+    feats['bb_width'] = (bb_upper - bb_lower) / ma20
+    feats['bb_position'] = np.where(bb_upper != bb_lower, (close - bb_lower) / (bb_upper - bb_lower), 0.5)
+    feats['price_above_bb_upper'] = (close > bb_upper).astype(int)
+    feats['price_below_bb_lower'] = (close < bb_lower).astype(int)
+
+    return feats
+
+
+def _get_or_compute_features(symbol, df):
+    """
+    按(symbol, 最新数据日)缓存calc_features_vectorized的结果
+    数据没有新K线时直接复用，多个调用方（scan/定时刷新/predict）共享同一次计算
+    """
+    feat_key = (symbol, df.index[-1].date(), len(df))
+    feats = _feat_cache.get(feat_key)
+    if feats is None:
+        feats = calc_features_vectorized(df)
+        if feats is None:
+            return None
+        _feat_cache[feat_key] = feats
+        if len(_feat_cache) > _FEAT_CACHE_MAX:
+            _feat_cache.popitem(last=False)  # 淘汰最久未用的
+    else:
+        _feat_cache.move_to_end(feat_key)
+    return feats
+
+
+def _cheap_rule_out(features, close):
     """
-    预测股票买卖信号
+    扫描场景的廉价排除规则：只短路RSI>75——建仓/持有分支分别要求
+    rsi<70/rsi<75，故RSI>75在最终信号判定里必然落到"🔴 减仓"，
+    可以先用现成特征判掉，省下一次LightGBM训练+推理。
+    其余减仓触发条件（5日回撤、破上轨+动量走弱）会被优先判定的
+    建仓/持有分支盖过，概率足够高时并不必然减仓，不能在此短路。
+    """
+    return features.iloc[-1].get('rsi_14', 50) > 75
+
+
+def predict_signal(symbol, name, train_window=200, cheap_filter=False):
+    """
+    预测股票买卖信号（获取数据 + 训练预测）
     - symbol: 股票代码
     - name: 股票名称
     - train_window: 训练窗口大小
+    - cheap_filter: 扫描模式下先用廉价规则排除必然"减仓"的股票，跳过模型训练
     """
     logger.info(f"开始预测股票 {symbol} ({name}) 的信号")
-    try:        
-        # 获取股票数据
+    try:
+        # I/O阶段：获取股票数据
         df = get_stock_daily(symbol)
+    except Exception as e:
+        logger.error(f"[{symbol}] 获取数据失败: {str(e)}", exc_info=True)
+        return None
+    return predict_from_df(df, symbol, name, train_window, cheap_filter)
+
+
+def predict_from_df(df, symbol, name, train_window=200, cheap_filter=False, save=True):
+    """
+    predict_signal的CPU阶段：特征计算+训练+推理
+    df由调用方提前取好，方便把I/O（线程）与CPU（进程池）分开调度
+    - save: False时不逐条入库，由调用方（如/scan）收集后批量保存
+    """
+    try:
         if df is None or df.empty or len(df) < train_window + 1:
             logger.warning(f"[{symbol}] 数据不足或获取失败，无法进行预测")
             return None
-    
+
         # 获取最新数据日期
         latest_data_date = df.index[-1].date()
         
@@ -173,50 +337,66 @@ def predict_signal(symbol, name, train_window=200):
         predict_date = get_next_trading_day(latest_data_date)
         predict_date_str = predict_date.strftime('%Y-%m-%d')
         
-        as_of_date = df.index[-1]
-        train_dates = df.index[-(train_window + 1):-1]
-
         logger.info(f"使用 {train_window} 天数据训练模型，预测日期：{predict_date_str}")
 
-        X_train = []
-        y_train = []
-
-        for d in train_dates:
-            idx = df.index.get_loc(d)
-            if idx + 1 >= len(df):
-                continue
-            next_day = df.index[idx + 1]
-            df_upto_d = df.loc[:d]
-            feat = calc_features_safe(df_upto_d)
-            if feat is None:
-                continue
-            X_train.append(feat)
-            ret = (df.loc[next_day, 'close'] - df.loc[d, 'close']) / df.loc[d, 'close']
-            y_train.append(int(ret > 0))
+        # 全量特征矩阵一次向量化算完（第j行≡calc_features_safe(df.iloc[:j+1])），
+        # 替代对每个训练日重算前缀特征的O(N²)循环
+        features = _get_or_compute_features(symbol, df)
+        if features is None:
+            return None
 
-        if len(X_train) < 50:
+        # 扫描模式：先判廉价排除规则，命中则省掉整个训练+推理
+        if cheap_filter and _cheap_rule_out(features, df['close']):
+            logger.info(f"[{symbol}] 命中廉价排除规则，跳过模型训练")
             return None
 
-        X_train = pd.DataFrame(X_train)
-        y_train = np.array(y_train)
+        # 训练区间：最后train_window个交易日（不含最新日），并跳过窗口不足60天的前缀行
+        n = len(df)
+        lo = max(n - (train_window + 1), 59)
+        X_train = features.iloc[lo:n - 1]
+        close_arr = df['close'].to_numpy(dtype=np.float64)
+        # 标签：次日是否上涨
+        y_train = (close_arr[lo + 1:n] > close_arr[lo:n - 1]).astype(int)
 
-        classes = np.unique(y_train)
-        class_weight = dict(zip(classes, compute_class_weight('balanced', classes=classes, y=y_train))) if len(classes) == 2 else None
+        if len(X_train) < 50:
+            return None
 
-        model = LGBMClassifier(
-            n_estimators=80,
-            max_depth=4,
-            random_state=42,
-            verbose=-1,
-            class_weight=class_weight
-        )
-        model.fit(X_train, y_train)
+        # 模型按(symbol, 最新数据日, 训练窗口)缓存：同一天重复调用直接复用已训练模型
+        model_key = (symbol, latest_data_date, train_window)
+        booster = _model_cache.get(model_key)
+        if booster is None:
+            classes = np.unique(y_train)
+            class_weight = dict(zip(classes, compute_class_weight('balanced', classes=classes, y=y_train))) if len(classes) == 2 else None
+
+            # max_bin=63/num_leaves=15适配200行×十几列的小矩阵，直方图构建更快；
+            # n_jobs=1：/scan已在进程级并行，单fit内再开线程只会互相争核
+            model = LGBMClassifier(
+                n_estimators=80,
+                max_depth=4,
+                num_leaves=15,
+                max_bin=63,
+                force_col_wise=True,
+                n_jobs=1,
+                random_state=42,
+                verbose=-1,
+                class_weight=class_weight
+            )
+            # 训练与预测直接喂连续float32数组，免去LightGBM对pandas对象的逐次dtype推断与拷贝
+            model.fit(X_train.to_numpy(dtype=np.float32), y_train)
+            # 只缓存底层Booster：推理走原生C接口，跳过sklearn包装层的校验/拷贝
+            booster = model.booster_
+            _model_cache[model_key] = booster
+            if len(_model_cache) > _MODEL_CACHE_MAX:
+                _model_cache.popitem(last=False)  # 淘汰最久未用的
+        else:
+            _model_cache.move_to_end(model_key)
 
-        feat_pred = calc_features_safe(df[df.index <= as_of_date])
-        if feat_pred is None:
-            return None
+        # 最新一行特征即最后交易日的预测输入（≡calc_features_safe(df)）
+        feat_pred = features.iloc[-1]
         feat_pred = feat_pred.reindex(X_train.columns, fill_value=0)
-        prob = model.predict_proba([feat_pred])[0][1]
+        x_pred = np.ascontiguousarray(feat_pred.to_numpy(dtype=np.float32)).reshape(1, -1)
+        # 二分类objective下Booster.predict直接给正类概率
+        prob = float(booster.predict(x_pred)[0])
 
         close = df['close']
         latest_close = close.iloc[-1]
@@ -247,46 +427,44 @@ def predict_signal(symbol, name, train_window=200):
             signal = "🟡 持有"
 
         senti = analyze_stock_sentiment(symbol)
-        
-        # 生成预测理由
-        reasons = []
-        
+
+        # 生成预测理由（模板为模块级常量，数值各round一次复用）
+        prob_pct = round(prob * 100, 1)
+        rsi_r = round(rsi, 1)
+
         # 基于预测概率的理由
         if prob > 0.60:
-            reasons.append(f"AI模型预测上涨概率为{round(prob*100, 1)}%，属于较高水平")
+            reasons = [_REASON_PROB_HIGH.format(prob_pct)]
         elif prob > 0.50:
-            reasons.append(f"AI模型预测上涨概率为{round(prob*100, 1)}%，属于中性偏上水平")
+            reasons = [_REASON_PROB_MID.format(prob_pct)]
         else:
-            reasons.append(f"AI模型预测上涨概率为{round(prob*100, 1)}%，属于较低水平")
-        
+            reasons = [_REASON_PROB_LOW.format(prob_pct)]
+
         # 基于RSI指标的理由
         if rsi > 75:
-            reasons.append(f"RSI指标为{round(rsi, 1)}，处于超买区域，短期上涨压力较大")
+            reasons.append(_REASON_RSI_OVERBOUGHT.format(rsi_r))
         elif rsi < 30:
-            reasons.append(f"RSI指标为{round(rsi, 1)}，处于超卖区域，短期下跌空间有限")
+            reasons.append(_REASON_RSI_OVERSOLD.format(rsi_r))
         elif rsi < 70:
-            reasons.append(f"RSI指标为{round(rsi, 1)}，处于合理区间，具有上涨潜力")
-        
+            reasons.append(_REASON_RSI_OK.format(rsi_r))
+
         # 基于布林带的理由
         if price_above_bb:
-            reasons.append("价格突破布林带上轨，短期可能面临回调压力")
-        
+            reasons.append(_REASON_ABOVE_BB)
+
         # 基于动量的理由
-        if mom_weakening:
-            reasons.append("动量正在减弱，上涨动能不足")
-        else:
-            reasons.append("动量保持稳定，上涨动能充足")
-        
+        reasons.append(_REASON_MOM_WEAK if mom_weakening else _REASON_MOM_OK)
+
         # 基于5日回撤的理由
         if drawdown_5d > 0.08:
-            reasons.append(f"5日回撤达到{round(drawdown_5d*100, 1)}%，短期调整幅度较大")
-        
+            reasons.append(_REASON_DRAWDOWN.format(round(drawdown_5d * 100, 1)))
+
         # 基于情感分析的理由
         if senti["label"] == "正面":
-            reasons.append(f"市场情绪为{senti['label']}，有利于股价上涨")
+            reasons.append(_REASON_SENTI_POS.format(senti['label']))
         elif senti["label"] == "负面":
-            reasons.append(f"市场情绪为{senti['label']}，不利于股价上涨")
-        
+            reasons.append(_REASON_SENTI_NEG.format(senti['label']))
+
         # 组合最终理由
         reason = "".join(reasons) + "。"
 
@@ -300,15 +478,16 @@ def predict_signal(symbol, name, train_window=200):
             "sentiment_label": senti["label"],
             "sentiment_score": senti["score"],
             "date": predict_date_str,
-            "rsi": round(rsi, 1),
+            "rsi": rsi_r,
             "price_above_bb_upper": price_above_bb,
             "mom_weakening": mom_weakening,
             "drawdown_5d": round(drawdown_5d * 100, 2),
             "reason": reason
         }
         
-        # 将预测结果保存到数据库
-        save_predict_result(result)
+        # 将预测结果保存到数据库（批量场景由调用方统一保存）
+        if save:
+            save_predict_result(result)
         return result
     except Exception as e:
         logger.error(f"[{symbol}] 预测失败: {str(e)}", exc_info=True)
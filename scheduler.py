@@ -1,7 +1,6 @@
 # scheduler.py
-import time
-import threading
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import os
 import warnings
@@ -16,6 +15,7 @@ warnings.filterwarnings('ignore')
 try:
     import akshare as ak
     import pandas as pd
+    from apscheduler.schedulers.background import BackgroundScheduler
     from data_fetch import get_stock_daily
     from predict import predict_signal
     from stock_utils import load_stocks_cache, save_stocks_cache, get_all_stocks
@@ -28,9 +28,6 @@ except ImportError as e:
 # ⏰ 定时任务配置
 # =================================
 
-# 股票列表定时更新间隔（24小时）
-STOCK_LIST_UPDATE_INTERVAL = 24 * 3600
-
 # 自动预测股票列表
 AUTO_PREDICT_STOCKS = [
     {"symbol": "000001", "name": "平安银行"},
@@ -45,119 +42,72 @@ AUTO_PREDICT_STOCKS = [
     {"symbol": "600030", "name": "中信证券"}
 ]
 
-# 自动预测间隔（1小时）
-AUTO_PREDICT_INTERVAL = 3600
-
-# 定时任务标志
-_stock_list_refreshing = False
-_predict_refreshing = False
+# 全局调度器实例（cron触发，替代轮询线程）
+_scheduler = None
 
 # =================================
 # ⏰ 定时任务函数
 # =================================
-def _scheduled_stock_list_update():
+def _stock_list_update_job():
     """
-    定时更新股票列表
+    更新股票列表（每天凌晨3点由调度器触发）
     """
-    global _stock_list_refreshing
-    logger.info("启动股票列表定时更新任务")
-    while True:
-        try:
-            if _stock_list_refreshing:
-                logger.info("股票列表更新任务正在执行中，跳过本次")
-                time.sleep(STOCK_LIST_UPDATE_INTERVAL)
-                continue
-            
-            _stock_list_refreshing = True
-            logger.info("开始执行股票列表更新任务")
-            
-            # 获取所有股票列表
-            stocks = get_all_stocks()
-            if not stocks.empty:
-                logger.info(f"成功获取 {len(stocks)} 支股票列表")
-                # 更新缓存
-                save_stocks_cache()
-                # 更新数据库
-                update_stock_list(stocks)
-            else:
-                logger.warning("获取股票列表失败")
-                
-        except Exception as e:
-            logger.error(f"股票列表定时更新失败: {str(e)}", exc_info=True)
-        finally:
-            _stock_list_refreshing = False
-        
-        # 等待下一次执行
-        logger.info(f"股票列表更新任务完成，等待 {STOCK_LIST_UPDATE_INTERVAL/3600:.1f} 小时后执行下一次")
-        time.sleep(STOCK_LIST_UPDATE_INTERVAL)
-
-
-def _scheduled_stock_prediction():
+    try:
+        logger.info("开始执行股票列表更新任务")
+
+        # 获取所有股票列表
+        stocks = get_all_stocks(force_refresh=True)
+        if not stocks.empty:
+            logger.info(f"成功获取 {len(stocks)} 支股票列表")
+            # 更新缓存
+            save_stocks_cache()
+            # 更新数据库
+            update_stock_list(stocks)
+        else:
+            logger.warning("获取股票列表失败")
+
+        logger.info("股票列表更新任务完成")
+    except Exception as e:
+        logger.error(f"股票列表定时更新失败: {str(e)}", exc_info=True)
+
+
+def _predict_one(stock):
+    """预测单只股票，返回是否成功（供线程池map调用）"""
+    symbol = stock["symbol"]
+    name = stock["name"]
+    try:
+        result = predict_signal(symbol, name)
+        if result:
+            logger.info(f"成功预测股票 {symbol} ({name})，信号：{result['signal']}")
+            return True
+        logger.warning(f"预测股票 {symbol} ({name}) 失败")
+        return False
+    except Exception as e:
+        logger.error(f"预测股票 {symbol} ({name}) 出错: {str(e)}", exc_info=True)
+        return False
+
+
+def _stock_prediction_job():
     """
-    定时预测已选股票
+    预测已选股票（交易日15:00由调度器触发，非交易日直接跳过）
     """
-    global _predict_refreshing
-    logger.info("启动股票预测定时任务")
-    while True:
-        try:
-            if _predict_refreshing:
-                logger.info("股票预测任务正在执行中，跳过本次")
-                time.sleep(AUTO_PREDICT_INTERVAL)
-                continue
-            
-            # 判断当前时间是否需要执行预测
-            current_time = datetime.now()
-            current_date = current_time.date()
-            current_hour = current_time.hour
-            current_minute = current_time.minute
-            current_weekday = current_time.weekday()
-            
-            # 检查是否为工作日
-            if current_weekday >= 5:  # 周末
-                logger.info("今天是周末，不执行股票预测任务")
-                time.sleep(AUTO_PREDICT_INTERVAL)
-                continue
-            
-            # 检查是否为交易日
-            today_is_trading_day = is_trading_day(current_date)
-            
-            # 只有在交易日的15:00-16:00之间执行预测
-            if today_is_trading_day and current_hour == 15 and 0 <= current_minute < 60:
-                _predict_refreshing = True
-                logger.info("开始执行股票预测任务")
-                
-                # 预测所有自动预测股票
-                success_count = 0
-                fail_count = 0
-                
-                for stock in AUTO_PREDICT_STOCKS:
-                    symbol = stock["symbol"]
-                    name = stock["name"]
-                    try:
-                        result = predict_signal(symbol, name)
-                        if result:
-                            logger.info(f"成功预测股票 {symbol} ({name})，信号：{result['signal']}")
-                            success_count += 1
-                        else:
-                            logger.warning(f"预测股票 {symbol} ({name}) 失败")
-                            fail_count += 1
-                    except Exception as e:
-                        logger.error(f"预测股票 {symbol} ({name}) 出错: {str(e)}", exc_info=True)
-                        fail_count += 1
-                
-                logger.info(f"股票预测任务完成，成功预测 {success_count} 支股票，失败 {fail_count} 支股票")
-                
-            else:
-                logger.info(f"当前时间 {current_time.strftime('%Y-%m-%d %H:%M:%S')} 不是股票预测时间，跳过本次")
-                
-        except Exception as e:
-            logger.error(f"股票预测定时任务失败: {str(e)}", exc_info=True)
-        finally:
-            _predict_refreshing = False
-        
-        # 等待下一次执行
-        logger.info(f"等待 {AUTO_PREDICT_INTERVAL/3600:.1f} 小时后执行下一次股票预测检查")
-        time.sleep(AUTO_PREDICT_INTERVAL)
+    try:
+        current_date = datetime.now().date()
+        if not is_trading_day(current_date):
+            logger.info(f"{current_date} 不是交易日，跳过股票预测任务")
+            return
+
+        logger.info("开始执行股票预测任务")
+
+        # 并发预测：大头是akshare/baostock的网络等待，线程池让HTTP延迟相互重叠
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            results = list(executor.map(_predict_one, AUTO_PREDICT_STOCKS))
+
+        success_count = sum(results)
+        fail_count = len(results) - success_count
+        logger.info(f"股票预测任务完成，成功预测 {success_count} 支股票，失败 {fail_count} 支股票")
+    except Exception as e:
+        logger.error(f"股票预测定时任务失败: {str(e)}", exc_info=True)
 
 # =================================
 # ⏰ 定时任务启动函数
@@ -166,28 +116,32 @@ def start_scheduled_tasks():
     """
     启动所有定时任务
     """
+    global _scheduler
     logger.info("正在启动定时任务系统...")
-    
+
     try:
         # 初始化数据库
         init_db()
-        
+
         # 加载股票列表缓存
         load_stocks_cache()
-        
-        # 启动股票列表定时更新线程
-        stock_list_thread = threading.Thread(target=_scheduled_stock_list_update, daemon=True)
-        stock_list_thread.start()
-        logger.info("股票列表定时更新线程已启动")
-        
-        # 启动股票预测定时线程
-        predict_thread = threading.Thread(target=_scheduled_stock_prediction, daemon=True)
-        predict_thread.start()
-        logger.info("股票预测定时线程已启动")
-        
+
+        # cron触发器在精确时刻唤醒，替代原先两个time.sleep轮询的常驻线程；
+        # max_instances=1 + coalesce=True 取代手工的_refreshing互斥标志
+        _scheduler = BackgroundScheduler()
+        _scheduler.add_job(_stock_list_update_job, 'cron', hour=3,
+                           max_instances=1, coalesce=True,
+                           next_run_time=datetime.now() + timedelta(seconds=10))
+        logger.info("股票列表更新任务已注册（每天03:00，启动后先执行一次）")
+
+        _scheduler.add_job(_stock_prediction_job, 'cron', day_of_week='mon-fri', hour=15, minute=0,
+                           max_instances=1, coalesce=True)
+        logger.info("股票预测任务已注册（周一至周五15:00）")
+
+        _scheduler.start()
         logger.info("所有定时任务已成功启动")
         return True
-        
+
     except Exception as e:
         logger.error(f"启动定时任务系统失败: {str(e)}", exc_info=True)
         return False
@@ -5,8 +5,11 @@ import time
 import warnings
 import logging
 from datetime import datetime
+from functools import lru_cache
+import gzip
 import os
 import pickle
+import re
 
 # 配置logging
 logger = logging.getLogger(__name__)
@@ -17,18 +20,38 @@ warnings.filterwarnings('ignore')
 
 try:
     import akshare as ak
-    from snownlp import SnowNLP
+    from snownlp import sentiment as snow_sentiment
     import jieba
 except ImportError as e:
     raise RuntimeError(f"Missing dependency: {e}")
 
-# 缓存文件路径定义
+# 股票列表/股吧接口走共享持久会话（keep-alive + 重试）
+from http_session import init_akshare_session
+init_akshare_session()
+
+# 导入时预热：jieba词典与SnowNLP情感模型只加载一次，
+# 之后每次打分不再触发惰性初始化
+try:
+    jieba.initialize()
+    snow_sentiment.classify('预热')
+except Exception as _e:
+    logger.warning(f"情感分析预热失败：{_e}")
+
+# 缓存文件路径定义（gzip压缩；旧的未压缩文件仅在加载时兼容）
 STOCKS_CACHE_FILE = 'stocks_cache.pkl'
+STOCKS_CACHE_GZ_FILE = STOCKS_CACHE_FILE + '.gz'
+
+# 特殊股票名称过滤（ST/退市/B股），模块级预编译
+_EXCLUDE_NAME_RE = re.compile('ST|退|B', re.IGNORECASE)
 
 # 全局股票列表缓存
 _stocks_cache = None
 _last_update_date = None
 
+# 代码 -> (名称, 板块) 的O(1)索引，随股票列表每天重建一次
+_code_index_cache = None
+_code_index_date = None
+
 # 定时任务标志
 _stocks_refreshing = False
 
@@ -42,13 +65,19 @@ def load_stocks_cache():
     """
     global _stocks_cache, _last_update_date
     try:
-        if os.path.exists(STOCKS_CACHE_FILE):
+        # 优先读压缩缓存，兼容旧的未压缩文件
+        if os.path.exists(STOCKS_CACHE_GZ_FILE):
+            with gzip.open(STOCKS_CACHE_GZ_FILE, 'rb') as f:
+                cache_data = pickle.load(f)
+        elif os.path.exists(STOCKS_CACHE_FILE):
             with open(STOCKS_CACHE_FILE, 'rb') as f:
                 cache_data = pickle.load(f)
-                _stocks_cache = cache_data['stocks']
-                _last_update_date = cache_data['last_update']
-                logger.info(f"从本地缓存加载股票列表成功，共 {len(_stocks_cache)} 条数据，最后更新日期：{_last_update_date}")
-                return True
+        else:
+            return False
+        _stocks_cache = cache_data['stocks']
+        _last_update_date = cache_data['last_update']
+        logger.info(f"从本地缓存加载股票列表成功，共 {len(_stocks_cache)} 条数据，最后更新日期：{_last_update_date}")
+        return True
     except Exception as e:
         logger.error(f"加载本地股票列表缓存失败：{e}")
     return False
@@ -65,9 +94,11 @@ def save_stocks_cache():
                 'stocks': _stocks_cache,
                 'last_update': _last_update_date
             }
-            with open(STOCKS_CACHE_FILE, 'wb') as f:
-                pickle.dump(cache_data, f)
-            logger.info(f"股票列表缓存已保存到本地文件：{STOCKS_CACHE_FILE}")
+            # compresslevel=1已够把文本型列压掉大半，压缩开销几乎不可感知
+            with gzip.open(STOCKS_CACHE_GZ_FILE, 'wb', compresslevel=1) as f:
+                # 协议5对DataFrame里的NumPy缓冲走out-of-band序列化，省一次大拷贝
+                pickle.dump(cache_data, f, protocol=5)
+            logger.info(f"股票列表缓存已保存到本地文件：{STOCKS_CACHE_GZ_FILE}")
             return True
     except Exception as e:
         logger.error(f"保存股票列表缓存到本地失败：{e}")
@@ -77,39 +108,47 @@ def save_stocks_cache():
 # ============================== 
 # 📊 工具函数
 # ==============================
+# 代码前缀 -> 板块（未命中默认主板）
+_BOARD_PREFIX = {'688': '科创板', '300': '创业板'}
+
+
 def get_market_board(symbol: str) -> str:
-    if symbol.startswith('688'):
-        return '科创板'
-    elif symbol.startswith('300'):
-        return '创业板'
-    else:
-        return '主板'
+    return _BOARD_PREFIX.get(symbol[:3], '主板')
 
 
-def get_all_stocks(force_refresh=False):
+def get_market_board_vec(codes: pd.Series) -> pd.Series:
+    """get_market_board的向量化版本：对整列代码一次性判定板块"""
+    return codes.str.slice(0, 3).map(_BOARD_PREFIX).fillna('主板')
+
+
+def get_all_stocks(force_refresh=False, copy=False):
     """
     获取所有A股股票列表
     - force_refresh: 是否强制刷新缓存
+    - copy: 是否返回缓存的副本；默认直接返回缓存帧（省一次MB级拷贝），
+      调用方只读不得原地修改，需要改动时自行传copy=True
     """
     global _stocks_cache, _last_update_date
-    
+
     # 检查是否需要更新缓存（每天更新一次）
     current_date = datetime.now().date()
     if _stocks_cache is not None and not force_refresh and _last_update_date == current_date:
-        return _stocks_cache.copy()
+        return _stocks_cache.copy() if copy else _stocks_cache
     
     try:
         # 获取股票数据
         logger.info("开始获取所有A股股票列表...")
         df = ak.stock_info_a_code_name()
         logger.info(f"获取到 {len(df)} 条股票数据")
-        # 筛选A股股票（代码格式：6位数字，前缀为0、3、6）
-        df = df[df['code'].str.match(r'^[036]\d{5}$')]
-        logger.info(f"筛选后 {len(df)} 条股票数据")
-        
-        # 过滤掉ST、退市、B股等特殊股票
-        df = df[~df['name'].str.contains('ST|退|B', case=False, na=False)]
-        logger.info(f"过滤后 {len(df)} 条股票数据")   
+        # 筛选A股股票（6位代码、前缀0/3/6）：长度+首字符判断替代逐行正则match
+        code_mask = (df['code'].str.len() == 6) & df['code'].str[0].isin(['0', '3', '6'])
+        # 过滤掉ST、退市、B股等特殊股票（预编译正则，一次contains）
+        name_mask = ~df['name'].fillna('').str.contains(_EXCLUDE_NAME_RE)
+        df = df.loc[code_mask & name_mask].copy()
+        # Arrow字符串列：比object列省约2/3内存，.str系列操作也更快
+        df['code'] = df['code'].astype('string[pyarrow]')
+        df['name'] = df['name'].astype('string[pyarrow]')
+        logger.info(f"筛选过滤后 {len(df)} 条股票数据")
         
         # 更新缓存
         _stocks_cache = df
@@ -119,43 +158,81 @@ def get_all_stocks(force_refresh=False):
         save_stocks_cache()
         
         logger.info(f"缓存更新完成，共 {len(df)} 条有效股票数据")
-        
-        return df.copy()
+
+        return df.copy() if copy else df
     except Exception as e:
         # 如果获取失败但有缓存，返回缓存数据
         if _stocks_cache is not None:
-            logger.warning(f"获取股票列表失败，但返回缓存数据：{e}") 
-            return _stocks_cache.copy()
+            logger.warning(f"获取股票列表失败，但返回缓存数据：{e}")
+            return _stocks_cache.copy() if copy else _stocks_cache
         raise RuntimeError(f"Failed to fetch stock list: {e}")
 
 
+def get_code_index(force_refresh=False):
+    """
+    获取股票代码到(名称, 板块)的字典索引
+    - 单次构建O(N)，之后每次代码查找O(1)，替代对DataFrame的布尔过滤扫描
+    - 与get_all_stocks共用每日刷新节奏，日期变化时自动重建
+    """
+    global _code_index_cache, _code_index_date
+
+    current_date = datetime.now().date()
+    if _code_index_cache is not None and not force_refresh and _code_index_date == current_date:
+        return _code_index_cache
+
+    df = get_all_stocks(force_refresh=force_refresh)
+    boards = get_market_board_vec(df['code'])
+    _code_index_cache = dict(zip(df['code'], zip(df['name'], boards)))
+    _code_index_date = current_date
+    logger.info(f"股票代码索引已重建，共 {len(_code_index_cache)} 条")
+    return _code_index_cache
+
+
 def get_guba_posts(symbol: str, pages=2):
     try:
         df = ak.stock_guba_em(symbol=symbol)
         if df.empty:
             return []
-        df = df.sort_values('read_count', ascending=False).head(pages * 20)
-        posts = (df['title'].fillna('') + '。' + df['content'].fillna('')).tolist()
-        return [p for p in posts if len(p) > 10]
+        # nlargest只维护top-k堆，O(N log k)优于全量排序
+        df = df.nlargest(pages * 20, 'read_count')
+        title = df['title'].fillna('')
+        content = df['content'].fillna('')
+        # 先按长度过滤（拼接后>10等价于标题+内容>9），只对保留行做字符串拼接
+        mask = (title.str.len() + content.str.len()) > 9
+        if not mask.any():
+            return []
+        return (title[mask] + '。' + content[mask]).tolist()
     except Exception:
         return []
 
 
 def basic_sentiment_score(text: str) -> float:
+    # 先用条件判断挡掉空/超短文本，不靠异常机制兜底
+    if not text or len(text) < 2:
+        return 0.0
     try:
-        s = SnowNLP(text)
-        return s.sentiments * 2 - 1
-    except:
+        # 直接调模块级Bayes分类器，跳过SnowNLP对象的整条流水线构造
+        return snow_sentiment.classify(text) * 2 - 1
+    except (ValueError, ZeroDivisionError):
+        # SnowNLP对极端输入可能解析失败/除零；其余异常属于真Bug，照常抛出
         return 0.0
 
 
-def analyze_stock_sentiment(symbol: str) -> dict:
+@lru_cache(maxsize=4096)
+def _analyze_stock_sentiment_cached(symbol, hour_bucket):
+    """analyze_stock_sentiment的实现，按(symbol, 小时桶)缓存；hour_bucket只用于换小时失效"""
     posts = get_guba_posts(symbol, pages=2)
     if not posts:
         return {"score": 0.0, "label": "❓ 无数据"}
-    
-    scores = [basic_sentiment_score(p) for p in posts[:30]]
-    avg_score = np.mean(scores) if scores else 0.0
+
+    batch = posts[:30]
+    try:
+        # fromiter直接落到float32数组，不经过Python list中转
+        scores = np.fromiter((basic_sentiment_score(p) for p in batch), dtype=np.float32, count=len(batch))
+        avg_score = float(scores.mean())
+    except Exception as e:
+        logger.warning(f"[{symbol}] 情感打分失败：{e}")
+        avg_score = 0.0
     
     if avg_score > 0.3:
         label = "🔥 看涨"
@@ -165,3 +242,8 @@ def analyze_stock_sentiment(symbol: str) -> dict:
         label = "😐 中性"
     
     return {"score": round(avg_score, 3), "label": label}
+
+
+def analyze_stock_sentiment(symbol: str) -> dict:
+    # 股吧情绪一小时内视为不变：同一symbol重复预测/扫描不再打akshare接口重新打分
+    return _analyze_stock_sentiment_cached(symbol, datetime.now().strftime('%Y%m%d%H'))
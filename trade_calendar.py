@@ -1,8 +1,12 @@
 # calendar.py
+import gzip
+import json
 import pandas as pd
 import time
 import logging
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, time as dt_time, timedelta
+from functools import lru_cache
+from bisect import bisect_left, bisect_right
 import os
 import pickle
 import warnings
@@ -21,12 +25,28 @@ try:
 except ImportError as e:
     raise RuntimeError(f"Missing dependency: {e}")
 
+# 交易日历接口走共享持久会话（keep-alive + 重试）
+from http_session import init_akshare_session
+init_akshare_session()
+
 # 交易日历缓存
 _trade_calendar_cache = {}
 _last_trade_calendar_update = None
 
-# 缓存文件路径定义
+# 排序好的交易日date列表（惰性构建，日历刷新时置空重建）
+_sorted_trade_dates = None
+
+# 缓存文件路径定义：npy存datetime64[D]日期数组（每个日期8字节、免pickle开销），
+# json旁挂元信息；旧的pickle文件仅在加载时兼容
+TRADE_CALENDAR_NPY_FILE = 'trade_calendar.npy'
+TRADE_CALENDAR_META_FILE = 'trade_calendar_meta.json'
 TRADE_CALENDAR_CACHE_FILE = 'trade_calendar_cache.pkl'
+TRADE_CALENDAR_CACHE_GZ_FILE = TRADE_CALENDAR_CACHE_FILE + '.gz'
+
+
+def _as_date(d):
+    """Timestamp/datetime/date统一归一化为date"""
+    return d.date() if hasattr(d, 'date') else d
 
 
 # ==============================
@@ -36,16 +56,39 @@ def load_trade_calendar_cache():
     """
     从文件加载交易日历缓存
     """
-    global _trade_calendar_cache, _last_trade_calendar_update
+    global _trade_calendar_cache, _last_trade_calendar_update, _sorted_trade_dates
     try:
-        if os.path.exists(TRADE_CALENDAR_CACHE_FILE):
+        # 优先读npy数组 + json元信息
+        if os.path.exists(TRADE_CALENDAR_NPY_FILE) and os.path.exists(TRADE_CALENDAR_META_FILE):
+            dates = np.load(TRADE_CALENDAR_NPY_FILE).astype('O').tolist()
+            with open(TRADE_CALENDAR_META_FILE, 'r') as f:
+                meta = json.load(f)
+            _trade_calendar_cache = {
+                'trade_dates': dates,
+                'trade_dates_ord': frozenset(d.toordinal() for d in dates),
+                'start_year': meta.get('start_year'),
+                'end_year': meta.get('end_year')
+            }
+            _last_trade_calendar_update = meta.get('last_update')
+            _sorted_trade_dates = None
+            logger.info("从本地文件加载交易日历缓存成功")
+            return True
+
+        # 兼容旧的pickle缓存（gzip或未压缩），下次保存即迁移到npy
+        if os.path.exists(TRADE_CALENDAR_CACHE_GZ_FILE):
+            with gzip.open(TRADE_CALENDAR_CACHE_GZ_FILE, 'rb') as f:
+                data = pickle.load(f)
+        elif os.path.exists(TRADE_CALENDAR_CACHE_FILE):
             with open(TRADE_CALENDAR_CACHE_FILE, 'rb') as f:
                 data = pickle.load(f)
-                if isinstance(data, dict) and 'calendar' in data and 'last_update' in data:
-                    _trade_calendar_cache = data['calendar']
-                    _last_trade_calendar_update = data['last_update']
-                    logger.info(f"从本地文件加载交易日历缓存成功")
-                    return True
+        else:
+            data = None
+        if isinstance(data, dict) and 'calendar' in data and 'last_update' in data:
+            _trade_calendar_cache = data['calendar']
+            _last_trade_calendar_update = data['last_update']
+            _sorted_trade_dates = None
+            logger.info(f"从本地文件加载交易日历缓存成功")
+            return True
     except Exception as e:
         logger.error(f"加载交易日历缓存失败：{e}")
     return False
@@ -56,10 +99,16 @@ def save_trade_calendar_cache():
     将交易日历缓存保存到文件
     """
     try:
-        with open(TRADE_CALENDAR_CACHE_FILE, 'wb') as f:
-            pickle.dump({
-                'calendar': _trade_calendar_cache,
-                'last_update': _last_trade_calendar_update
+        trade_dates = _trade_calendar_cache.get('trade_dates') if _trade_calendar_cache else None
+        if not trade_dates:
+            return False
+        arr = np.array([_as_date(d) for d in trade_dates], dtype='datetime64[D]')
+        np.save(TRADE_CALENDAR_NPY_FILE, arr)
+        with open(TRADE_CALENDAR_META_FILE, 'w') as f:
+            json.dump({
+                'last_update': _last_trade_calendar_update,
+                'start_year': _trade_calendar_cache.get('start_year'),
+                'end_year': _trade_calendar_cache.get('end_year')
             }, f)
         logger.info(f"交易日历缓存已保存到本地文件")
         return True
@@ -77,11 +126,11 @@ def get_trade_calendar(start_year=2020, end_year=2030):
     - start_year: 开始年份
     - end_year: 结束年份
     """
-    global _trade_calendar_cache, _last_trade_calendar_update
-    
+    global _trade_calendar_cache, _last_trade_calendar_update, _sorted_trade_dates
+
     # 检查缓存是否存在且未过期（7天）
     if _trade_calendar_cache and _last_trade_calendar_update and (time.time() - _last_trade_calendar_update < 7 * 24 * 3600):
-        logger.info("使用缓存的交易日历")
+        logger.debug("使用缓存的交易日历")
         return _trade_calendar_cache
     
     try:
@@ -117,19 +166,24 @@ def get_trade_calendar(start_year=2020, end_year=2030):
         
         # 转换为日期列表
         trade_dates = trade_calendar_df['trade_date'].tolist()
-        trade_dates_set = set(trade_dates)
-        
+        # 序数frozenset做成员判定：int哈希比Timestamp便宜一个量级，整个集合也小得多
+        trade_dates_ord = frozenset(d.toordinal() for d in trade_dates)
+
         # 构建缓存数据
         _trade_calendar_cache = {
             'trade_dates': trade_dates,
-            'trade_dates_set': trade_dates_set,
+            'trade_dates_ord': trade_dates_ord,
             'start_year': start_year,
             'end_year': end_year
         }
         
         # 更新缓存时间
         _last_trade_calendar_update = time.time()
-        
+
+        # 日历内容变化，清空按日期记忆的判定缓存与排序列表
+        _is_trading_day_ord.cache_clear()
+        _sorted_trade_dates = None
+
         # 保存缓存
         save_trade_calendar_cache()
         
@@ -138,33 +192,54 @@ def get_trade_calendar(start_year=2020, end_year=2030):
         
     except Exception as e:
         logger.error(f"获取交易日历失败: {str(e)}", exc_info=True)
-        # 如果获取失败，尝试使用本地缓存
-        if os.path.exists(TRADE_CALENDAR_CACHE_FILE):
-            logger.info("获取交易日历失败，尝试使用本地缓存")
-            load_trade_calendar_cache()
+        # 如果获取失败，尝试使用本地缓存（npy/旧pickle的存在性判断都在加载函数内处理）
+        logger.info("获取交易日历失败，尝试使用本地缓存")
+        load_trade_calendar_cache()
         return _trade_calendar_cache
 
 
+@lru_cache(maxsize=4096)
+def _is_trading_day_ord(ord_int):
+    """按日期序数缓存的交易日判断，日历刷新时由get_trade_calendar清空"""
+    calendar = get_trade_calendar()
+    if not calendar:
+        logger.error("交易日历缓存不存在或格式错误")
+        return False
+    if 'trade_dates_ord' in calendar:
+        return ord_int in calendar['trade_dates_ord']
+    # 兼容旧格式的本地缓存（Timestamp集合），日历下次刷新后自动换成序数集合
+    if 'trade_dates_set' in calendar:
+        query_dt = datetime.combine(date.fromordinal(ord_int), datetime.min.time())
+        return query_dt in calendar['trade_dates_set']
+    logger.error("交易日历缓存不存在或格式错误")
+    return False
+
+
 def is_trading_day(query_date):
     """
     判断给定日期是否为交易日
-    - date: 日期对象或日期字符串
+    - query_date: 日期对象或日期字符串
     """
+    # 归一化为date后查序数缓存，重复查询同一天时免去日历查找与类型转换
     if isinstance(query_date, str):
-        query_date = pd.to_datetime(query_date)
-    # 如果query_date是date对象，转换为datetime对象
-    if isinstance(query_date, date):
-        query_date = datetime.combine(query_date, datetime.min.time())
-    
-    # 获取交易日历
-    calendar = get_trade_calendar()
-    if not calendar or 'trade_dates_set' not in calendar:
-        logger.error("交易日历缓存不存在或格式错误")
-        return False
-    
-    # 判断是否为交易日
-    logger.info(f"{query_date} 是否为交易日: {query_date in calendar['trade_dates_set']}")
-    return query_date in calendar['trade_dates_set']
+        query_date = pd.to_datetime(query_date).date()
+    elif isinstance(query_date, datetime):
+        query_date = query_date.date()
+    return _is_trading_day_ord(query_date.toordinal())
+
+
+def _get_sorted_trade_dates():
+    """
+    返回排序好的交易日date列表
+    只在日历刷新后重建一次，供bisect做O(log N)查找
+    """
+    global _sorted_trade_dates
+    if _sorted_trade_dates is None:
+        calendar = get_trade_calendar()
+        if not calendar or 'trade_dates' not in calendar:
+            return None
+        _sorted_trade_dates = sorted(_as_date(d) for d in calendar['trade_dates'])
+    return _sorted_trade_dates
 
 
 def get_next_trading_day(date=None, count=1):
@@ -179,28 +254,14 @@ def get_next_trading_day(date=None, count=1):
         date = pd.to_datetime(date).date()
     elif hasattr(date, 'date'):
         date = date.date()
-    
-    # 获取交易日历
-    calendar = get_trade_calendar()
-    if not calendar or 'trade_dates' not in calendar:
+
+    trade_dates = _get_sorted_trade_dates()
+    if not trade_dates:
         return None
-    
-    # 找到下一个交易日
-    trade_dates = [d.date() for d in calendar['trade_dates']]
-    trade_dates.sort()
-    
-    found = False
-    result = date
-    found_count = 0
-    
-    while not found and result <= trade_dates[-1]:
-        result += timedelta(days=1)
-        if result in trade_dates:
-            found_count += 1
-            if found_count == count:
-                found = True
-    
-    return result if found else None
+
+    # bisect定位第一个大于基准日的交易日，再偏移count-1
+    idx = bisect_right(trade_dates, date) + (count - 1)
+    return trade_dates[idx] if idx < len(trade_dates) else None
 
 
 def get_previous_trading_day(date=None, count=1):
@@ -215,28 +276,14 @@ def get_previous_trading_day(date=None, count=1):
         date = pd.to_datetime(date).date()
     elif hasattr(date, 'date'):
         date = date.date()
-    
-    # 获取交易日历
-    calendar = get_trade_calendar()
-    if not calendar or 'trade_dates' not in calendar:
+
+    trade_dates = _get_sorted_trade_dates()
+    if not trade_dates:
         return None
-    
-    # 找到上一个交易日
-    trade_dates = [d.date() for d in calendar['trade_dates']]
-    trade_dates.sort()
-    
-    found = False
-    result = date
-    found_count = 0
-    
-    while not found and result >= trade_dates[0]:
-        result -= timedelta(days=1)
-        if result in trade_dates:
-            found_count += 1
-            if found_count == count:
-                found = True
-    
-    return result if found else None
+
+    # bisect定位最后一个小于基准日的交易日，再往前偏移count-1
+    idx = bisect_left(trade_dates, date) - count
+    return trade_dates[idx] if idx >= 0 else None
 
 
 def get_trading_days_in_range(start_date, end_date):
@@ -249,27 +296,34 @@ def get_trading_days_in_range(start_date, end_date):
         start_date = pd.to_datetime(start_date).date()
     elif hasattr(start_date, 'date'):
         start_date = start_date.date()
-    
+
     if isinstance(end_date, str):
         end_date = pd.to_datetime(end_date).date()
     elif hasattr(end_date, 'date'):
         end_date = end_date.date()
-    
-    # 获取交易日历
-    calendar = get_trade_calendar()
-    if not calendar or 'trade_dates' not in calendar:
+
+    trade_dates = _get_sorted_trade_dates()
+    if not trade_dates:
         return []
-    
-    # 筛选指定范围内的交易日
-    trade_dates = [d.date() for d in calendar['trade_dates']]
-    trade_dates.sort()
-    
-    result = []
-    for date in trade_dates:
-        if start_date <= date <= end_date:
-            result.append(date)
-    
-    return result
+
+    # 两次bisect切出闭区间，替代整表线性过滤
+    lo = bisect_left(trade_dates, start_date)
+    hi = bisect_right(trade_dates, end_date)
+    return trade_dates[lo:hi]
+
+
+# 交易时段边界（9:30-11:30, 13:00-15:00），模块级常量
+_AM_OPEN, _AM_CLOSE = dt_time(9, 30), dt_time(11, 30)
+_PM_OPEN, _PM_CLOSE = dt_time(13, 0), dt_time(15, 0)
+
+
+def in_trading_session(now=None):
+    """
+    仅判断时刻是否落在交易时段（9:30-11:30, 13:00-15:00），不看交易日历
+    - time对象直接比较，替代各处重复的小时/分钟四分支判断
+    """
+    t = (now or datetime.now()).time()
+    return _AM_OPEN <= t <= _AM_CLOSE or _PM_OPEN <= t < _PM_CLOSE
 
 
 def is_trading_hours():
@@ -279,24 +333,17 @@ def is_trading_hours():
     """
     current_time = datetime.now()
     current_date = current_time.date()
-    current_hour = current_time.hour
-    current_minute = current_time.minute
-    current_weekday = current_time.weekday()
-    
+
     # 判断是否为周末
-    if current_weekday >= 5:
+    if current_time.weekday() >= 5:
         return False
-    
+
     # 判断是否为交易日
     if not is_trading_day(current_date):
         return False
-    
+
     # 判断是否在交易时段内
-    if 9 <= current_hour < 15:
-        if (current_hour == 9 and current_minute >= 30) or (10 <= current_hour < 11) or (current_hour == 11 and current_minute <= 30) or (13 <= current_hour < 15):
-            return True
-    
-    return False
+    return in_trading_session(current_time)
 
 
 def get_next_trading_hours_start(date=None):
@@ -328,11 +375,10 @@ def get_current_trading_day():
     """
     current_time = datetime.now()
     current_date = current_time.date()
-    logger.info(f"当前时间 {current_time}，当前日期为 {current_date}")
     # 如果current_date不是‘yyyy-mm-dd hh:mm:ss’格式，强制转换为datetime对象
     if not isinstance(current_date, datetime):
         current_date = datetime.combine(current_date, datetime.min.time())
-    logger.info(f"转换后的当前日期为 {current_date}")
+    logger.debug("当前时间 %s，判定用日期 %s", current_time, current_date)
     if is_trading_day(current_date):
         return current_date
     else:
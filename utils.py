@@ -7,10 +7,8 @@ import logging
 from datetime import datetime
 import os
 import pickle
-# AkShare 获取（增加重试次数、超时处理和指数退避）
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+# AkShare 获取走共享持久会话（keep-alive + 重试 + 指数退避），模块级构建一次
+from http_session import init_akshare_session as _init_ak_session
 
 # 导入数据库操作模块
 from db import query_stock_data, check_data_completeness, batch_insert_stock_data, init_db, test_db_connection
@@ -33,102 +31,55 @@ warnings.filterwarnings('ignore')
 try:
     import akshare as ak
     from lightgbm import LGBMClassifier
-    from snownlp import SnowNLP
-    import jieba
     import baostock as bs
     from db import save_predict_result, query_predict_results  # 导入数据库操作函数
 except ImportError as e:
     raise RuntimeError(f"Missing dependency: {e}")
 
+# numba为可选依赖：缺失时@njit退化为普通Python函数
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+        if len(args) == 1 and callable(args[0]):
+            return decorator(args[0])
+        return decorator
+
 # ==============================
 # 📦 Baostock 初始化
 # ==============================
 _bs_initialized = False
 
 # 缓存文件路径定义
-STOCKS_CACHE_FILE = 'stocks_cache.pkl'
 PREDICT_CACHE_FILE = 'predict_cache.pkl'
 
-# 全局股票列表缓存
-_stocks_cache = None
-_last_update_date = None
-
 # predict_signal缓存
 _predict_cache = {}
 _last_predict_update = {}
 
+# 已训练模型缓存：symbol -> ((数据截止日, 训练窗口), 模型)
+# 数据没有新K线时跳过重训（每小时的自动预测任务反复命中同一截止日）
+_model_cache = {}
+
 # 定时任务标志
 _stocks_refreshing = False
 _predict_refreshing = False
 
 import threading
+from concurrent.futures import ThreadPoolExecutor
 import time
 from datetime import datetime, timedelta
 
-# 获取交易日历缓存
-_trade_calendar = None
-_trade_calendar_updated = None
-
-def get_trade_calendar():
-    """
-    获取交易日历，使用akshare获取新浪财经的交易日历
-    缓存机制：每天更新一次日历
-    """
-    global _trade_calendar, _trade_calendar_updated
-    today = datetime.today().date()
-    
-    # 如果缓存为空或超过一天未更新，则更新缓存
-    if _trade_calendar is None or _trade_calendar_updated != today:
-        try:
-            logger.info("更新交易日历缓存")
-            # 获取1990年至今的交易日历
-            df = ak.tool_trade_date_hist_sina()
-            # 转换为日期类型
-            df['trade_date'] = pd.to_datetime(df['trade_date'], format='%Y%m%d').dt.date
-            # 只保留交易日期列
-            _trade_calendar = set(df['trade_date'])
-            _trade_calendar_updated = today
-            logger.info("交易日历缓存更新成功")
-        except Exception as e:
-            logger.error(f"获取交易日历失败: {str(e)}")
-            # 如果获取失败，使用简单的周一到周五作为备选
-            _trade_calendar = None
-            _trade_calendar_updated = None
-    
-    return _trade_calendar
-
-def get_next_trading_day(base_date=None):
-    """
-    获取下一个交易日，考虑周末和法定假期
-    
-    Args:
-        base_date: 基准日期，如果为None则使用当前日期
-        
-    Returns:
-        date: 下一个交易日的日期
-    """
-    if base_date is None:
-        base_date = datetime.today().date()
-    elif isinstance(base_date, str):
-        base_date = datetime.strptime(base_date, '%Y-%m-%d').date()
-    
-    trade_calendar = get_trade_calendar()
-    
-    # 从基准日期的下一天开始查找
-    next_day = base_date + timedelta(days=1)
-    
-    while True:
-        # 首先检查是否是交易日
-        if trade_calendar is not None:
-            if next_day in trade_calendar:
-                return next_day
-        else:
-            # 如果没有交易日历，使用简单的周一到周五规则
-            if next_day.weekday() < 5:  # 0-4代表周一到周五
-                return next_day
-        
-        # 不是交易日，继续查找下一天
-        next_day += timedelta(days=1)
+# 交易日历与股票列表缓存统一走专用模块：
+# 此前本文件维护了第二份日历集合与股票缓存，HTTP拉取和内存都是双份
+from trade_calendar import is_trading_day as _calendar_is_trading_day, get_next_trading_day, in_trading_session as _in_trading_session
+from stock_utils import load_stocks_cache, save_stocks_cache, get_all_stocks, get_market_board, get_market_board_vec
+# 股吧情绪分析统一走stock_utils（批量打分 + 按小时缓存）
+from stock_utils import get_guba_posts, basic_sentiment_score, analyze_stock_sentiment
+# 全量特征矩阵的向量化实现与predict模块共用一份
+from predict import calc_features_vectorized
 
 def _init_baostock():
     """
@@ -172,42 +123,6 @@ def _logout_baostock():
 # ==============================
 import pickle
 
-def load_stocks_cache():
-    """
-    从本地文件加载股票列表缓存
-    """
-    global _stocks_cache, _last_update_date
-    try:
-        if os.path.exists(STOCKS_CACHE_FILE):
-            with open(STOCKS_CACHE_FILE, 'rb') as f:
-                cache_data = pickle.load(f)
-                _stocks_cache = cache_data['stocks']
-                _last_update_date = cache_data['last_update']
-                logger.info(f"从本地缓存加载股票列表成功，共 {len(_stocks_cache)} 条数据，最后更新日期：{_last_update_date}")
-                return True
-    except Exception as e:
-        logger.error(f"加载本地股票列表缓存失败：{e}")
-    return False
-
-def save_stocks_cache():
-    """
-    将股票列表缓存保存到本地文件
-    """
-    global _stocks_cache, _last_update_date
-    try:
-        if _stocks_cache is not None and _last_update_date is not None:
-            cache_data = {
-                'stocks': _stocks_cache,
-                'last_update': _last_update_date
-            }
-            with open(STOCKS_CACHE_FILE, 'wb') as f:
-                pickle.dump(cache_data, f)
-            logger.info(f"股票列表缓存已保存到本地文件：{STOCKS_CACHE_FILE}")
-            return True
-    except Exception as e:
-        logger.error(f"保存股票列表缓存到本地失败：{e}")
-    return False
-
 def load_predict_cache():
     """
     从数据库加载预测结果缓存
@@ -251,93 +166,6 @@ def save_predict_cache():
     logger.info("预测结果已直接保存到数据库，不需要再保存到本地文件")
     return True
 
-# ============================== 
-# 📊 工具函数
-# ==============================
-def get_market_board(symbol: str) -> str:
-    if symbol.startswith('688'):
-        return '科创板'
-    elif symbol.startswith('300'):
-        return '创业板'
-    else:
-        return '主板'
-
-def get_all_stocks(force_refresh=False):
-    """
-    获取所有A股股票列表
-    - force_refresh: 是否强制刷新缓存
-    """
-    global _stocks_cache, _last_update_date
-    
-    # 检查是否需要更新缓存（每天更新一次）
-    current_date = datetime.now().date()
-    if _stocks_cache is not None and not force_refresh and _last_update_date == current_date:
-        return _stocks_cache.copy()
-    
-    try:
-        # 获取股票数据
-        logger.info("开始获取所有A股股票列表...")
-        df = ak.stock_info_a_code_name()
-        logger.info(f"获取到 {len(df)} 条股票数据")
-        # 筛选A股股票（代码格式：6位数字，前缀为0、3、6）
-        df = df[df['code'].str.match(r'^[036]\d{5}$')]
-        logger.info(f"筛选后 {len(df)} 条股票数据")
-        
-        # 过滤掉ST、退市、B股等特殊股票
-        df = df[~df['name'].str.contains('ST|退|B', case=False, na=False)]
-        logger.info(f"过滤后 {len(df)} 条股票数据")   
-        
-        # 更新缓存
-        _stocks_cache = df
-        _last_update_date = current_date
-        
-        # 保存到本地文件
-        save_stocks_cache()
-        
-        logger.info(f"缓存更新完成，共 {len(df)} 条有效股票数据")
-        
-        return df.copy()
-    except Exception as e:
-        # 如果获取失败但有缓存，返回缓存数据
-        if _stocks_cache is not None:
-            logger.warning(f"获取股票列表失败，但返回缓存数据：{e}") 
-            return _stocks_cache.copy()
-        raise RuntimeError(f"Failed to fetch stock list: {e}")
-
-def get_guba_posts(symbol: str, pages=2):
-    try:
-        df = ak.stock_guba_em(symbol=symbol)
-        if df.empty:
-            return []
-        df = df.sort_values('read_count', ascending=False).head(pages * 20)
-        posts = (df['title'].fillna('') + '。' + df['content'].fillna('')).tolist()
-        return [p for p in posts if len(p) > 10]
-    except Exception:
-        return []
-
-def basic_sentiment_score(text: str) -> float:
-    try:
-        s = SnowNLP(text)
-        return s.sentiments * 2 - 1
-    except:
-        return 0.0
-
-def analyze_stock_sentiment(symbol: str) -> dict:
-    posts = get_guba_posts(symbol, pages=2)
-    if not posts:
-        return {"score": 0.0, "label": "❓ 无数据"}
-    
-    scores = [basic_sentiment_score(p) for p in posts[:30]]
-    avg_score = np.mean(scores) if scores else 0.0
-    
-    if avg_score > 0.3:
-        label = "🔥 看涨"
-    elif avg_score < -0.2:
-        label = "❄️ 看跌"
-    else:
-        label = "😐 中性"
-    
-    return {"score": round(avg_score, 3), "label": label}
 
 # ==============================
 # 📈 数据获取（双源容错 + 数据库缓存）
@@ -360,21 +188,13 @@ def get_stock_daily(symbol: str):
             logger.info(f"[{symbol}] 从数据库获取到完整数据，共 {len(df_db)} 条")
             
             # 检查当前时间是否在交易时段
-            today = datetime.now().date()
             current_time = datetime.now()
-            current_hour = current_time.hour
-            current_minute = current_time.minute
-            
-            # 获取交易日历
-            trade_calendar = get_trade_calendar()
-            is_trading_day = today in trade_calendar if trade_calendar is not None else True
-            
-            # 判断是否在交易时段（9:30-11:30, 13:00-15:00）
-            is_trading_hours = False
-            if 9 <= current_hour < 15:
-                if (current_hour == 9 and current_minute >= 30) or (10 <= current_hour < 11) or (current_hour == 11 and current_minute <= 30) or (13 <= current_hour < 15):
-                    is_trading_hours = True
-            
+            today = current_time.date()
+
+            # 统一交易日历与交易时段判定
+            is_trading_day = _calendar_is_trading_day(today)
+            is_trading_hours = _in_trading_session(current_time)
+
             logger.info(f"当前时间: {current_time}, 是交易日: {is_trading_day}, 是交易时间: {is_trading_hours}")
             
             # 如果是交易日并且在交易时段，重新获取当天的数据
@@ -385,24 +205,9 @@ def get_stock_daily(symbol: str):
                 today_str = today.strftime("%Y%m%d")
                 
                 try:
-                    # 为AkShare配置请求重试策略
-                    session = requests.Session()
-                    retry_strategy = Retry(
-                        total=3,
-                        status_forcelist=[429, 500, 502, 503, 504],
-                        allowed_methods=["HEAD", "GET", "OPTIONS"],
-                        backoff_factor=1  # 指数退避
-                    )
-                    adapter = HTTPAdapter(max_retries=retry_strategy)
-                    session.mount("http://", adapter)
-                    session.mount("https://", adapter)
-                    
-                    # 设置全局超时
-                    session.timeout = 10  # 10秒超时
-                    
-                    # 替换AkShare的默认会话
-                    ak._session = session
-                    
+                    # 复用共享持久会话
+                    _init_ak_session()
+
                     # 获取当天的数据
                     df_today = ak.stock_zh_a_hist(
                         symbol=symbol,
@@ -442,16 +247,11 @@ def get_stock_daily(symbol: str):
                             save_df = df_today[['open', 'high', 'low', 'close', 'volume']].copy().reset_index()
                             batch_insert_stock_data(save_df, symbol)
                             
-                            # 更新内存中的数据
-                            if today in df_db.index.date:
-                                # 如果数据库中已有当天的数据，替换它
-                                df_db = df_db[df_db.index.date != today]
-                                df_db = pd.concat([df_db, df_today])
-                                df_db.sort_index(inplace=True)
-                            else:
-                                # 如果数据库中没有当天的数据，添加它
-                                df_db = pd.concat([df_db, df_today])
-                                df_db.sort_index(inplace=True)
+                            # 更新内存中的数据：二分定位当天起始位置切掉旧的当天行（若有），
+                            # 替代对整个索引逐元素.date比较的布尔掩码
+                            # 前缀本身有序且当天行必然最新，拼接后无需整表重排
+                            cut = df_db.index.searchsorted(pd.Timestamp(today))
+                            df_db = pd.concat([df_db.iloc[:cut], df_today])
                             
                             logger.info(f"[{symbol}] 成功更新当天数据")
                         else:
@@ -467,26 +267,11 @@ def get_stock_daily(symbol: str):
     else:
         logger.info(f"[{symbol}] 数据库数据不完整，需要从外部API获取数据")
     
-    # 为AkShare配置请求重试策略
-    session = requests.Session()
-    retry_strategy = Retry(
-        total=3,
-        status_forcelist=[429, 500, 502, 503, 504],
-        allowed_methods=["HEAD", "GET", "OPTIONS"],
-        backoff_factor=1  # 指数退避
-    )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    
-    # 设置全局超时
-    session.timeout = 10  # 10秒超时
-    
+    # 复用共享持久会话
+    _init_ak_session()
+
     for attempt in range(3):  # 增加到3次重试
         try:
-            # 替换AkShare的默认会话
-            ak._session = session
-            
             df_ak = ak.stock_zh_a_hist(
                 symbol=symbol,
                 period="daily",
@@ -567,24 +352,31 @@ def get_stock_daily(symbol: str):
                 time.sleep(1)
                 continue
             
-            data_list = []
+            # 边读边解析为定型数据：日期串 + float64矩阵，
+            # 跳过"逐行list套list → 字符串DataFrame → pd.to_numeric逐列转换"的中间过程
+            dates = []
+            rows = []
             while rs.next():
-                data_list.append(rs.get_row_data())
-            
-            if not data_list:
+                row = rs.get_row_data()  # date,open,high,low,close,volume,amount
+                try:
+                    vals = [float(x) for x in row[1:6]]
+                except ValueError:
+                    continue  # 空串/脏数据行，等价于原来的dropna
+                dates.append(row[0])
+                rows.append(vals)
+
+            if not dates:
                 logger.warning(f"[{symbol}] Baostock 无数据")
                 continue
 
-            df_bs = pd.DataFrame(data_list, columns=['date','open','high','low','close','volume','amount'])
-            df_bs['date'] = pd.to_datetime(df_bs['date'])
-            df_bs.set_index('date', inplace=True)
+            df_bs = pd.DataFrame(
+                np.array(rows, dtype=np.float64),
+                columns=['open', 'high', 'low', 'close', 'volume'],
+                index=pd.to_datetime(dates, format='%Y-%m-%d')
+            )
+            df_bs.index.name = 'date'
             df_bs.sort_index(inplace=True)
-            
-            # 转换数值类型
-            for col in ['open','high','low','close','volume','amount']:
-                df_bs[col] = pd.to_numeric(df_bs[col], errors='coerce')
-            df_bs.dropna(inplace=True)
-            
+
             # 清洗
             df_bs = df_bs[
                 (df_bs['close'] > 0.1) &
@@ -610,67 +402,75 @@ def get_stock_daily(symbol: str):
 # ==============================
 # 🤖 特征与预测
 # ==============================
+@njit(cache=True)
+def _macd_last(close):
+    """
+    单次遍历计算MACD的DIF/DEA末值
+    - EMA12/EMA26/DEA（DIF的9日EMA）在同一循环内递推，
+      替代三次独立的ewm全序列计算
+    """
+    alpha12 = 2.0 / 13.0
+    alpha26 = 2.0 / 27.0
+    alpha9 = 2.0 / 10.0
+    ema12 = close[0]
+    ema26 = close[0]
+    dea = 0.0
+    for i in range(1, close.shape[0]):
+        c = close[i]
+        ema12 += alpha12 * (c - ema12)
+        ema26 += alpha26 * (c - ema26)
+        dea += alpha9 * (ema12 - ema26 - dea)
+    return ema12 - ema26, dea
+
+
 def calc_features_safe(df_slice):
     if len(df_slice) < 60:
         return None
-    high = df_slice['high']
-    low = df_slice['low']
-    close = df_slice['close']
-    volume = df_slice['volume']
-    
+    # 一次性取出NumPy数组，后续指标全部走切片计算，
+    # 不再对重叠窗口反复调用pandas的tail/diff/ewm（训练循环里每次预测要调约200次）
+    close = df_slice['close'].to_numpy(dtype=np.float64)
+    volume = df_slice['volume'].to_numpy(dtype=np.float64)
+    latest = close[-1]
+
+    # 长度已保证>=60，各窗口无需再单独判断
     features = {}
-    features['mom_5'] = close.iloc[-1] / close.iloc[-6] - 1 if len(close) >= 6 else 0
-    features['mom_20'] = close.iloc[-1] / close.iloc[-21] - 1 if len(close) >= 21 else 0
-    
-    ma5 = close.tail(5).mean()
-    ma20 = close.tail(20).mean()
-    ma60 = close.tail(60).mean() if len(close) >= 60 else ma20
+    features['mom_5'] = latest / close[-6] - 1
+    features['mom_20'] = latest / close[-21] - 1
+
+    ma5 = close[-5:].mean()
+    ma20 = close[-20:].mean()
+    ma60 = close[-60:].mean()
     features['ma5'] = ma5
     features['ma20'] = ma20
     features['ma60'] = ma60
     features['ma_align'] = int(ma5 > ma20 > ma60)
-    features['price_to_ma20'] = (close.iloc[-1] - ma20) / ma20
-
-    if len(close) >= 15:
-        delta = close.diff().iloc[-14:]
-        gain = delta.where(delta > 0, 0).mean()
-        loss = (-delta.where(delta < 0, 0)).mean()
-        rs = gain / loss if loss != 0 else 0
-        features['rsi_14'] = 100 - (100 / (1 + rs)) if rs != 0 else 50
-    else:
-        features['rsi_14'] = 50
-
-    if len(close) >= 26:
-        ema12 = close.ewm(span=12, adjust=False).mean().iloc[-1]
-        ema26 = close.ewm(span=26, adjust=False).mean().iloc[-1]
-        dif = ema12 - ema26
-        dif_series = close.ewm(span=12).mean() - close.ewm(span=26).mean()
-        dea = dif_series.tail(9).mean()
-        hist = (dif - dea) * 2
-        features['macd_dif'] = dif
-        features['macd_dea'] = dea
-        features['macd_hist'] = hist
-        features['macd_bullish'] = int(hist > 0)
-    else:
-        features.update({'macd_dif':0, 'macd_dea':0, 'macd_hist':0, 'macd_bullish':0})
-
-    vol_ma5 = volume.tail(5).mean()
-    features['vol_ratio_5'] = volume.iloc[-1] / vol_ma5 if vol_ma5 != 0 else 1
-
-    if len(close) >= 20:
-        bb_ma = close.tail(20).mean()
-        bb_std = close.tail(20).std()
-        bb_upper = bb_ma + 2 * bb_std
-        bb_lower = bb_ma - 2 * bb_std
-        price = close.iloc[-1]
-        features['bb_width'] = (bb_upper - bb_lower) / bb_ma
-        features['bb_position'] = (price - bb_lower) / (bb_upper - bb_lower) if bb_upper != bb_lower else 0.5
-        features['price_above_bb_upper'] = int(price > bb_upper)
-        features['price_below_bb_lower'] = int(price < bb_lower)
-    else:
-        features.update({'bb_width':0, 'bb_position':0.5, 'price_above_bb_upper':0, 'price_below_bb_lower':0})
-
-    return pd.Series(features)
+    features['price_to_ma20'] = (latest - ma20) / ma20
+
+    delta = np.diff(close[-15:])
+    gain = np.maximum(delta, 0).mean()
+    loss = np.maximum(-delta, 0).mean()
+    rs = gain / loss if loss != 0 else 0
+    features['rsi_14'] = 100 - (100 / (1 + rs)) if rs != 0 else 50
+
+    dif, dea = _macd_last(close)
+    hist = (dif - dea) * 2
+    features['macd_dif'] = dif
+    features['macd_dea'] = dea
+    features['macd_hist'] = hist
+    features['macd_bullish'] = int(hist > 0)
+
+    vol_ma5 = volume[-5:].mean()
+    features['vol_ratio_5'] = volume[-1] / vol_ma5 if vol_ma5 != 0 else 1
+
+    bb_std = close[-20:].std(ddof=1)  # ddof=1与pandas一致
+    bb_upper = ma20 + 2 * bb_std
+    bb_lower = ma20 - 2 * bb_std
+    features['bb_width'] = (bb_upper - bb_lower) / ma20
+    features['bb_position'] = (latest - bb_lower) / (bb_upper - bb_lower) if bb_upper != bb_lower else 0.5
+    features['price_above_bb_upper'] = int(latest > bb_upper)
+    features['price_below_bb_lower'] = int(latest < bb_lower)
+
+    return features
 
 def predict_signal(symbol, name, train_window=200,):
     """
@@ -684,23 +484,11 @@ def predict_signal(symbol, name, train_window=200,):
         # 判断当前时间是否在开盘日的交易时段（9:30-11:30, 13:00-15:00）
         current_time = datetime.now()
         current_date = current_time.date()
-        current_hour = current_time.hour
-        current_minute = current_time.minute
-        current_seconds = current_time.second
-        
-        # 获取交易日历
-        trade_calendar = get_trade_calendar()
-        
-        # 判断是否为开盘日的交易时段
-        is_trading_day = current_date in trade_calendar if trade_calendar is not None else True
-        is_trading_hours = False
-        if 9 <= current_hour < 15:
-            if (current_hour == 9 and current_minute >= 30) or (10 <= current_hour < 11) or (current_hour == 11 and current_minute <= 30) or (13 <= current_hour < 15):
-                is_trading_hours = True
-        # 确保15点整之后不处理
-        if current_hour >= 15 and (current_minute > 0 or current_seconds > 0):
-            is_trading_hours = False
-        
+
+        # 统一交易日历与交易时段判定（时段上界为开区间，15点后自然不命中）
+        is_trading_day = _calendar_is_trading_day(current_date)
+        is_trading_hours = _in_trading_session(current_time)
+
         logger.info(f"当前时间: {current_time}, 是交易日: {is_trading_day}, 是交易时间: {is_trading_hours}")
         
         # 获取股票数据
@@ -717,48 +505,51 @@ def predict_signal(symbol, name, train_window=200,):
         predict_date_str = predict_date.strftime('%Y-%m-%d')
         
         as_of_date = df.index[-1]
-        train_dates = df.index[-(train_window + 1):-1]
 
-        X_train = []
-        y_train = []
+        # 全量特征矩阵一次向量化算完（第j行≡calc_features_safe(df.iloc[:j+1])），
+        # 替代对每个训练日期重复计算前缀指标的O(N²)循环
+        feats = calc_features_vectorized(df)
+        if feats is None:
+            return None
 
-        for d in train_dates:
-            idx = df.index.get_loc(d)
-            if idx + 1 >= len(df):
-                continue
-            next_day = df.index[idx + 1]
-            df_upto_d = df.loc[:d]
-            feat = calc_features_safe(df_upto_d)
-            if feat is None:
-                continue
-            X_train.append(feat)
-            ret = (df.loc[next_day, 'close'] - df.loc[d, 'close']) / df.loc[d, 'close']
-            y_train.append(int(ret > 0))
+        n = len(df)
+        close_arr = df['close'].to_numpy(dtype=np.float64)
+        # 前59行窗口不足含NaN，训练样本从第60行起
+        lo = max(n - (train_window + 1), 59)
+        hi = n - 1
+        # 直接落成float32二维ndarray喂给LightGBM：直方图分箱下精度无损，
+        # 进分箱器的内存带宽减半，整个热路径不再经过pandas往返
+        X_train = feats.iloc[lo:hi].to_numpy(dtype=np.float32)
+        y_train = (close_arr[lo + 1:hi + 1] > close_arr[lo:hi]).astype(int)
 
         if len(X_train) < 50:
             return None
 
-        X_train = pd.DataFrame(X_train)
-        y_train = np.array(y_train)
-
-        from sklearn.utils.class_weight import compute_class_weight
-        classes = np.unique(y_train)
-        class_weight = dict(zip(classes, compute_class_weight('balanced', classes=classes, y=y_train))) if len(classes) == 2 else None
+        # 数据截止日未变时复用已训练模型，训练是单次预测的主要开销
+        model_key = (latest_data_date, train_window)
+        cached_model = _model_cache.get(symbol)
+        if cached_model is not None and cached_model[0] == model_key:
+            model = cached_model[1]
+        else:
+            from sklearn.utils.class_weight import compute_class_weight
+            classes = np.unique(y_train)
+            class_weight = dict(zip(classes, compute_class_weight('balanced', classes=classes, y=y_train))) if len(classes) == 2 else None
+
+            model = LGBMClassifier(
+                n_estimators=80,
+                max_depth=4,
+                random_state=42,
+                verbose=-1,
+                class_weight=class_weight
+            )
+            model.fit(X_train, y_train)
+            _model_cache[symbol] = (model_key, model)
 
-        model = LGBMClassifier(
-            n_estimators=80,
-            max_depth=4,
-            random_state=42,
-            verbose=-1,
-            class_weight=class_weight
-        )
-        model.fit(X_train, y_train)
-
-        feat_pred = calc_features_safe(df[df.index <= as_of_date])
-        if feat_pred is None:
-            return None
-        feat_pred = feat_pred.reindex(X_train.columns, fill_value=0)
-        prob = model.predict_proba([feat_pred])[0][1]
+        # 最新一行特征即最后交易日的预测输入（≡calc_features_safe(df)）；
+        # 特征列顺序由calc_features_vectorized固定，无需再reindex对齐
+        feat_pred = feats.iloc[-1]
+        x_pred = feat_pred.to_numpy(dtype=np.float32).reshape(1, -1)
+        prob = model.predict_proba(x_pred)[0][1]
 
         close = df['close']
         latest_close = close.iloc[-1]
@@ -904,11 +695,8 @@ def _scheduled_stock_prediction():
             current_minute = current_time.minute
             current_date = current_time.date()
             
-            # 获取交易日历
-            trade_calendar = get_trade_calendar()
-            
-            # 判断是否为交易日
-            is_trading_day = current_date in trade_calendar if trade_calendar is not None else True
+            # 判断是否为交易日（统一交易日历判定）
+            is_trading_day = _calendar_is_trading_day(current_date)
             
             # 判断是否为收盘后时间（15:00之后）
             is_after_market_close = current_hour >= 15
@@ -958,9 +746,8 @@ def start_scheduled_tasks():
     # 初始化数据库
     init_db()
     
-    # 如果本地没有缓存或缓存过期，初始化股票列表缓存
-    if _stocks_cache is None:
-        get_all_stocks()
+    # 如果本地没有缓存或缓存过期，初始化股票列表缓存（get_all_stocks自带按日缓存判断）
+    get_all_stocks()
     
     # 启动股票列表定时更新任务
     stocks_thread = threading.Thread(target=_scheduled_stocks_refresh, daemon=True)
@@ -975,59 +762,82 @@ def start_scheduled_tasks():
 # ==============================
 # 🔁 回测（简化版，仅返回指标）
 # ==============================
+# 回测用日线缓存：(symbol, 当天日期) -> 完整日线DataFrame
+# 同一天内反复回测不再重新打数据库/外部API
+_daily_cache = {}
+
+
+def _get_stock_daily_cached(symbol):
+    key = (symbol, datetime.now().date())
+    df = _daily_cache.get(key)
+    if df is None:
+        # 日期翻转时一次性清掉旧条目，缓存不随天数膨胀
+        for k in [k for k in _daily_cache if k[1] != key[1]]:
+            del _daily_cache[k]
+        df = get_stock_daily(symbol)
+        # 只缓存成功结果：空DataFrame（双源都失败）不入缓存，下次照常重试
+        if df is not None and not df.empty:
+            _daily_cache[key] = df
+    return df
+
+
 def backtest_ai_strategy_cached(board_filter, top_k, min_prob, lookback_days):
     stocks_df = get_all_stocks()
     if board_filter != "全部":
-        stocks_df = stocks_df[stocks_df['code'].apply(get_market_board) == board_filter].reset_index(drop=True)
+        # 板块判定整列向量化，替代逐行apply
+        stocks_df = stocks_df[get_market_board_vec(stocks_df['code']) == board_filter].reset_index(drop=True)
 
     valid_symbols = []
     all_prices = {}
-    for _, row in stocks_df.iterrows():
-        symbol = row['code']
-        df = get_stock_daily(symbol)
+    all_dfs = {}  # symbol -> 完整日线，日期循环内直接复用
+    codes = stocks_df['code'].tolist()
+    # 逐只拉日线是DB/网络I/O，线程池重叠往返（GIL在I/O期间释放）
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        dfs = list(executor.map(_get_stock_daily_cached, codes))
+    for symbol, df in zip(codes, dfs):
         if not df.empty and len(df) >= lookback_days + 50:
             all_prices[symbol] = df['close']
+            all_dfs[symbol] = df
             valid_symbols.append(symbol)
 
     if not valid_symbols:
         return None
 
-    common_dates = set(all_prices[valid_symbols[0]].index)
-    for sym in valid_symbols[:5]:
-        common_dates &= set(all_prices[sym].index)
-    common_dates = sorted(common_dates)[-lookback_days:]
+    # Index.intersection走C层求交且保持有序，不再经由Python set重建再排序
+    idx = all_prices[valid_symbols[0]].index
+    for sym in valid_symbols[1:5]:
+        idx = idx.intersection(all_prices[sym].index)
+    common_dates = idx.sort_values()[-lookback_days:]
     if len(common_dates) < 30:
         return None
 
     nav = 1.0
     daily_rets = []
 
-    for i in range(len(common_dates) - 1):
-        t0 = common_dates[i]
-        t1 = common_dates[i + 1]
+    syms = valid_symbols[:100]  # 限100只防超时
+    # 价格矩阵一次对齐（index=日期, columns=symbol），收益整体向量化；
+    # 缺价日在reindex后为NaN，收益自然为NaN并被当日剔除
+    price_matrix = pd.concat({s: all_prices[s] for s in syms}, axis=1).reindex(common_dates)
+    prices = price_matrix.to_numpy(dtype=np.float64)
+    rets = prices[1:] / prices[:-1] - 1  # 第i行 = t_i -> t_{i+1} 收益
 
-        signals = []
-        for sym in valid_symbols[:100]:  # 限100只防超时
-            if t0 not in all_prices[sym].index or t1 not in all_prices[sym].index:
-                continue
-            try:
-                full_df = get_stock_daily(sym)
-                if t0 not in full_df.index:
-                    continue
-                df_upto_t0 = full_df[full_df.index <= t0]
-                feat = calc_features_safe(df_upto_t0)
-                if feat is None:
-                    continue
-                prob = 0.52  # 简化：实际应训练模型预测
-                if prob >= min_prob / 100.0:
-                    ret = (all_prices[sym].loc[t1] - all_prices[sym].loc[t0]) / all_prices[sym].loc[t0]
-                    signals.append((prob, ret))
-            except Exception:
-                continue
+    # 每只股票在各t0时点的历史K线数（特征需要>=60根），二分一次算完
+    hist_counts = np.stack([
+        all_dfs[s].index.searchsorted(common_dates, side='right') for s in syms
+    ], axis=1)
 
-        signals.sort(reverse=True)
-        selected = signals[:top_k]
-        daily_ret = np.mean([r for _, r in selected]) if selected else 0.0
+    prob = 0.52  # 简化：实际应训练模型预测
+    prob_ok = prob >= min_prob / 100.0
+
+    for i in range(len(common_dates) - 1):
+        row_rets = rets[i]
+        valid = ~np.isnan(row_rets) & (hist_counts[i] >= 60)
+        if prob_ok and valid.any():
+            # prob全相等时原排序等价于按收益取前top_k
+            selected = np.sort(row_rets[valid])[::-1][:top_k]
+            daily_ret = float(selected.mean())
+        else:
+            daily_ret = 0.0
         nav *= (1 + daily_ret)
         daily_rets.append(daily_ret)
 